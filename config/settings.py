@@ -28,6 +28,16 @@ class Settings:
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
     GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-pro')
     GEMINI_MAX_TOKENS = int(os.getenv('GEMINI_MAX_TOKENS', '100000'))
+    # Identical prompts within the TTL reuse the previous response instead of calling the API again
+    GEMINI_CACHE_SIZE = int(os.getenv('GEMINI_CACHE_SIZE', '1024'))
+    GEMINI_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CACHE_TTL_SECONDS', '600'))
+    # Optional Redis (e.g. redis://localhost:6379/0) sharing cached responses between processes and hosts
+    REDIS_URL = os.getenv('REDIS_URL', '')
+    GEMINI_REDIS_TTL_SECONDS = int(os.getenv('GEMINI_REDIS_TTL_SECONDS', '3600'))
+    # Concurrent batch requests: in-flight cap, request-rate quota, and retries on 429 responses
+    GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+    GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '60'))
+    GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '5'))
     
     # Base directory setup
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -42,30 +52,57 @@ class Settings:
     RAW_ATTACHMENTS_DIR = os.path.join(DATA_DIR, 'raw_attachments')
     FRAUD_ANALYSIS_DIR = os.path.join(DATA_DIR, 'fraud_analysis')
     
-    # Create directories if they don't exist
-    os.makedirs(PROCESSED_EMAILS_DIR, exist_ok=True)
-    os.makedirs(COMPILED_PDFS_DIR, exist_ok=True)
-    os.makedirs(PROCESSING_QUEUE_DIR, exist_ok=True)
-    os.makedirs(PROCESSED_CLAIMS_DIR, exist_ok=True)
-    os.makedirs(REPORTS_DIR, exist_ok=True)
-    os.makedirs(RAW_ATTACHMENTS_DIR, exist_ok=True)
-    os.makedirs(FRAUD_ANALYSIS_DIR, exist_ok=True)
-    
     # Email Filtering
     CLAIMS_KEYWORDS = os.getenv('CLAIMS_KEYWORDS', 'claim,marine,insurance,reinsurance,loss,damage').split(',')
     
     # Processing Settings
     MAX_EMAILS_PER_RUN = 50
+    IMAP_FETCH_BATCH_SIZE = int(os.getenv('IMAP_FETCH_BATCH_SIZE', '50'))  # Messages per IMAP FETCH command
+    IMAP_FETCH_CONNECTIONS = int(os.getenv('IMAP_FETCH_CONNECTIONS', '1'))  # Parallel IMAP sessions per fetch batch
+    EMAIL_PROCESS_WORKERS = int(os.getenv('EMAIL_PROCESS_WORKERS', '4'))  # Emails processed concurrently, each worker with its own IMAP session
+    IMAP_POOL_SIZE = int(os.getenv('IMAP_POOL_SIZE', '8'))  # Logged-in IMAP sessions kept idle for reuse between runs
+    IMAP_KEEPALIVE_SECONDS = int(os.getenv('IMAP_KEEPALIVE_SECONDS', '1200'))  # NOOP idle sessions this often, under the ~30 min server timeout
     PROCESS_ONLY_UNREAD = True
+    # Store identical attachments once under PROCESSED_EMAILS_DIR/_cas and hard-link them into email folders
+    ATTACHMENT_DEDUP_ENABLED = os.getenv('ATTACHMENT_DEDUP_ENABLED', 'true').lower() == 'true'
     
     # Processing Pipeline Settings
     AUTO_PROCESS_AFTER_EXTRACTION = True
     PROCESSING_BATCH_SIZE = 5  # Reduced for API rate limits
+    CLAIM_ANALYSIS_BATCH_SIZE = int(os.getenv('CLAIM_ANALYSIS_BATCH_SIZE', '20'))  # Claims per Gemini analysis request
+    FRAUD_ANALYSIS_BATCH_SIZE = int(os.getenv('FRAUD_ANALYSIS_BATCH_SIZE', '10'))  # Claims per Gemini fraud request
+    
+    # Document Extraction Settings
+    DOC_EXTRACT_WORKERS = int(os.getenv('DOC_EXTRACT_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))
+    # Extraction results keyed by file path, mtime and size, so reprocessing skips PDF/OCR work
+    EXTRACTION_CACHE_ENABLED = os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true'
+    EXTRACTION_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR', os.path.join(DATA_DIR, 'extraction_cache'))
+    EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv('EXTRACTION_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))  # 0 = never expire
+    EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', '5000'))  # Oldest files are swept beyond this; 0 = unbounded
+    
+    # Dashboard Settings
+    # Let the front-end web server send report files (Apache mod_xsendfile / lighttpd)
+    DASHBOARD_USE_X_SENDFILE = os.getenv('DASHBOARD_USE_X_SENDFILE', 'false').lower() == 'true'
+    # nginx internal location aliasing REPORTS_DIR, e.g. '/internal-reports/'
+    DASHBOARD_X_ACCEL_PREFIX = os.getenv('DASHBOARD_X_ACCEL_PREFIX', '')
     
     # Fraud Detection Settings
     FRAUD_THRESHOLD = float(os.getenv('FRAUD_THRESHOLD', '0.7'))
     DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.8'))
     ENABLE_FRAUD_DETECTION = True
     ENABLE_DUPLICATE_CHECK = True
+    
+    _dirs_ready = False
+    
+    @classmethod
+    def ensure_dirs(cls):
+        """Create the data directories once per process (not at import time)"""
+        if cls._dirs_ready:
+            return
+        for directory in (cls.PROCESSED_EMAILS_DIR, cls.COMPILED_PDFS_DIR, cls.PROCESSING_QUEUE_DIR,
+                          cls.PROCESSED_CLAIMS_DIR, cls.REPORTS_DIR, cls.RAW_ATTACHMENTS_DIR,
+                          cls.FRAUD_ANALYSIS_DIR):
+            os.makedirs(directory, exist_ok=True)
+        cls._dirs_ready = True
 
 settings = Settings()
\ No newline at end of file
@@ -5,12 +5,19 @@ Flask Dashboard for Marine Reinsurance Claims Processing System
 
 import os
 import sys
-import json
 import logging
 from datetime import datetime
-from typing import List, Dict, Any
-from threading import Thread, Event
+from typing import List, Dict, Any, Tuple
+from threading import Thread, Event, Lock
+from collections import deque
 import time
+import imaplib
+import unicodedata
+from functools import lru_cache
+from operator import itemgetter
+from urllib.parse import quote
+
+import orjson
 
 # Add the src directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,10 +25,20 @@ src_dir = os.path.dirname(os.path.dirname(current_dir))
 if src_dir not in sys.path:
     sys.path.insert(0, src_dir)
 
-from flask import Flask, render_template, send_file, jsonify, request
+from flask import Flask, render_template, send_file, jsonify, request, url_for
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.utils import safe_join
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
 from config.settings import settings
 from processing.pipeline import ClaimsProcessingPipeline
+from emails.email_client import MailboxWatcher, IdleUnavailableError
+from imapclient.exceptions import IMAPClientAbortError
 from utils.logger import setup_logger
+from utils.cache import TTLCache
+from utils.helpers import read_json_file, iter_jsonl_file
 
 # Setup logging
 logger = setup_logger(__name__)
@@ -29,98 +46,235 @@ logger = setup_logger(__name__)
 app = Flask(__name__)
 app.secret_key = 'marine_claims_dashboard_secret_key'
 
+# Skip per-render template stat() checks; the bytecode cache is attached in start_dashboard
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+
+# Static assets are versioned by filename, so let browsers cache them for a year
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 31536000
+
+# Front-end libraries: (file under static/vendor/, CDN fallback). Dropping the files into
+# src/dashboard/static/vendor/ serves them locally and avoids the extra DNS/TLS round trips.
+VENDOR_ASSETS = {
+    'bootstrap_css': ('bootstrap-5.1.3.min.css', 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css'),
+    'bootstrap_js': ('bootstrap-5.1.3.bundle.min.js', 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js'),
+    'fontawesome_css': ('fontawesome-6.0.0/css/all.min.css', 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css'),
+}
+
+@lru_cache(maxsize=None)
+def _vendor_asset_is_local(filename: str) -> bool:
+    """Check once whether a vendored copy of an asset is installed"""
+    return os.path.isfile(os.path.join(app.static_folder, 'vendor', filename))
+
+@app.template_global('asset_url')
+def asset_url(name: str) -> str:
+    """URL for a front-end library, preferring the local vendored copy"""
+    filename, cdn_url = VENDOR_ASSETS[name]
+    if _vendor_asset_is_local(filename):
+        return url_for('static', filename=f'vendor/{filename}')
+    return cdn_url
+
+# Hand report downloads to the front-end server instead of streaming them through Python
+app.use_x_sendfile = settings.DASHBOARD_USE_X_SENDFILE
+
+# Compress HTML/JSON responses (report listings are highly redundant text)
+app.config['COMPRESS_MIMETYPES'] = ['text/html', 'application/json', 'text/css']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_BR_LEVEL'] = 5
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+if Compress:
+    Compress(app)
+else:
+    logger.warning("flask-compress not installed; responses will not be compressed")
+
 # Global variables for background processing
 processing_pipeline = None
 background_thread = None
 stop_event = Event()
-latest_updates = []
+latest_updates = deque(maxlen=20)  # Newest first; oldest dropped automatically
+_updates_lock = Lock()
+_updates_version = 0  # Bumped on every in-memory update; part of the /api/updates ETag
+
+# Short-lived cache for the polled API endpoints
+API_CACHE_TTL_SECONDS = 5
+_api_cache = TTLCache(maxsize=8, ttl=API_CACHE_TTL_SECONDS)
+
+# Upper bound on how long the background thread blocks before re-checking
+POLL_CEILING_SECONDS = 60
+
+# Reports listing pagination
+REPORTS_PER_PAGE = 50
+MAX_REPORTS_PER_PAGE = 500
+
+# Parsed JSON files keyed by path -> (st_mtime_ns, st_size, data)
+_JSON_CACHE: Dict[str, Tuple[int, int, Any]] = {}
+
+def _load_json(path: str, loader=read_json_file) -> Any:
+    """Load a JSON file, reusing the parsed object while the file is unchanged"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _JSON_CACHE.get(path)
+    if hit and hit[:2] == key:
+        return hit[2]
+    
+    data = loader(path)
+    _JSON_CACHE[path] = (*key, data)
+    return data
+
+def _format_size(value: float) -> str:
+    """Human readable file size"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if value < 1024.0:
+            return f"{value:.1f} {unit}"
+        value /= 1024.0
+    return f"{value:.1f} TB"
+
+def _risk_class(fraud_score: float) -> str:
+    """Bootstrap colour class for a fraud score"""
+    if fraud_score > 0.7:
+        return 'danger'
+    elif fraud_score > 0.4:
+        return 'warning'
+    else:
+        return 'success'
+
+def _risk_fields(fraud_score: float) -> Dict[str, Any]:
+    """Precomputed risk display fields for a report"""
+    return {'fraud_score': fraud_score, 'risk_class': _risk_class(fraud_score), 'risk_pct': int(fraud_score * 100)}
+
+@lru_cache(maxsize=2048)
+def _company_from_email(email: str) -> str:
+    """Derive a company name from the sender's email domain"""
+    if not email or '@' not in email:
+        return 'Unknown'
+    try:
+        return email.split('@', 1)[1].split('.', 1)[0].title()
+    except IndexError:
+        return 'Unknown'
 
 class DashboardManager:
     def __init__(self):
         self.reports_dir = settings.REPORTS_DIR
         self.processed_claims_file = os.path.join(settings.PROCESSED_CLAIMS_DIR, 'processed_claims.json')
-        self.processing_log_file = os.path.join(settings.REPORTS_DIR, 'processing_log.json')
+        self.processing_log_file = os.path.join(settings.REPORTS_DIR, 'processing_log.jsonl')
+        self.legacy_processing_log_file = os.path.join(settings.REPORTS_DIR, 'processing_log.json')
+        
+        # Report listing cache invalidated on directory mtime
+        self._reports_cache = []
+        self._reports_cache_mtime = None
     
     def get_all_reports(self) -> List[Dict[str, Any]]:
         """Get all generated reports with metadata"""
         reports = []
         
         try:
+            dir_mtime = os.stat(self.reports_dir).st_mtime_ns
+            if dir_mtime == self._reports_cache_mtime:
+                return self._reports_cache
+            
             # Get report files
-            for filename in os.listdir(self.reports_dir):
-                if filename.startswith('claim_report_') and filename.endswith('.pdf'):
-                    file_path = os.path.join(self.reports_dir, filename)
-                    stat = os.stat(file_path)
-                    
-                    # Extract claim number from filename
-                    claim_number = filename.replace('claim_report_', '').replace('.pdf', '')
-                    parts = claim_number.split('_')
-                    if len(parts) >= 2:
-                        claim_number = parts[0]
-                    
-                    reports.append({
-                        'filename': filename,
-                        'file_path': file_path,
-                        'claim_number': claim_number,
-                        'created_at': datetime.fromtimestamp(stat.st_ctime),
-                        'size': stat.st_size,
-                        'download_url': f'/download/{filename}'
-                    })
+            with os.scandir(self.reports_dir) as entries:
+                for entry in entries:
+                    filename = entry.name
+                    if filename.startswith('claim_report_') and filename.endswith('.pdf'):
+                        stat = entry.stat()
+                        
+                        # Extract claim number from filename
+                        claim_number = filename.replace('claim_report_', '').replace('.pdf', '')
+                        parts = claim_number.split('_')
+                        if len(parts) >= 2:
+                            claim_number = parts[0]
+                        
+                        reports.append({
+                            'filename': filename,
+                            'file_path': entry.path,
+                            'claim_number': claim_number,
+                            'created_ts': stat.st_ctime,
+                            'size': stat.st_size,
+                            'download_url': f'/download/{filename}'
+                        })
+            
+            # Sort by raw creation timestamp (newest first), then build datetimes once
+            reports.sort(key=itemgetter('created_ts'), reverse=True)
+            for report in reports:
+                report['created_at'] = datetime.fromtimestamp(report['created_ts'])
+                report['created_at_str'] = report['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+                report['size_str'] = _format_size(report['size'])
             
-            # Sort by creation date (newest first)
-            reports.sort(key=lambda x: x['created_at'], reverse=True)
+            self._reports_cache = reports
+            self._reports_cache_mtime = dir_mtime
             
         except Exception as e:
             logger.error(f"Error getting reports: {str(e)}")
         
         return reports
     
-    def get_reports_by_company(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Group reports by company name"""
-        reports = self.get_all_reports()
+    def _group_by_company(self, reports: List[Dict[str, Any]]) -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+        """Group prefetched reports by company and count high risk claims in one pass"""
         companies = {}
+        high_risk_claims = 0
         
-        # Try to extract company names from processed claims data
         try:
-            if os.path.exists(self.processed_claims_file):
-                with open(self.processed_claims_file, 'r', encoding='utf-8') as f:
-                    processed_claims = json.load(f)
+            processed_claims = _load_json(self.processed_claims_file) or {}
+            
+            # Index reports by claim number (a claim may have several reports)
+            reports_by_claim = {}
+            for report in reports:
+                reports_by_claim.setdefault(report['claim_number'], []).append(report)
+            
+            for claim_number, claim_data in processed_claims.items():
+                fraud_score = claim_data.get('fraud_score', 0)
+                if fraud_score > 0.7:
+                    high_risk_claims += 1
                 
-                for claim_number, claim_data in processed_claims.items():
-                    company_name = claim_data.get('sender_email', 'Unknown Company')
-                    # Extract domain name as company identifier
-                    if '@' in company_name:
-                        company_name = company_name.split('@')[1].split('.')[0].title()
-                    
-                    if company_name not in companies:
-                        companies[company_name] = []
-                    
-                    # Find matching report
-                    for report in reports:
-                        if report['claim_number'] == claim_number:
-                            report['company_name'] = company_name
-                            report['subject'] = claim_data.get('subject', 'No Subject')
-                            report['fraud_score'] = claim_data.get('fraud_score', 0)
-                            companies[company_name].append(report)
-                            break
+                company_name = _company_from_email(claim_data.get('sender_email', ''))
+                
+                company_reports = companies.setdefault(company_name, [])
+                
+                # Annotate copies so the cached report list is never modified
+                subject = claim_data.get('subject', 'No Subject')
+                risk = _risk_fields(fraud_score)
+                for report in reports_by_claim.get(claim_number, ()):
+                    company_reports.append({
+                        **report,
+                        **risk,
+                        'company_name': company_name,
+                        'subject': subject
+                    })
             
             # Add reports without company info to "Unknown" category
+            unknown_claims = reports_by_claim.keys() - processed_claims.keys()
             for report in reports:
-                if 'company_name' not in report:
-                    if 'Unknown' not in companies:
-                        companies['Unknown'] = []
-                    report['company_name'] = 'Unknown'
-                    report['subject'] = 'No subject information'
-                    report['fraud_score'] = 0
-                    companies['Unknown'].append(report)
+                if report['claim_number'] in unknown_claims:
+                    companies.setdefault('Unknown', []).append({
+                        **report,
+                        'company_name': 'Unknown',
+                        **_risk_fields(0),
+                        'subject': 'No subject information'
+                    })
                     
         except Exception as e:
             logger.error(f"Error grouping reports by company: {str(e)}")
         
-        return companies
+        return companies, high_risk_claims
+    
+    def get_reports_by_company(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Group reports by company name"""
+        return self._group_by_company(self.get_all_reports())[0]
     
     def get_processing_stats(self) -> Dict[str, Any]:
         """Get processing statistics"""
+        reports = self.get_all_reports()
+        companies, high_risk_claims = self._group_by_company(reports)
+        return self._stats(reports, companies, high_risk_claims)
+    
+    def _stats(self, reports: List[Dict[str, Any]], companies: Dict[str, List[Dict[str, Any]]],
+               high_risk_claims: int) -> Dict[str, Any]:
+        """Build processing statistics from prefetched reports and company grouping"""
         stats = {
             'total_reports': 0,
             'companies_count': 0,
@@ -130,50 +284,41 @@ class DashboardManager:
         }
         
         try:
-            reports = self.get_all_reports()
             stats['total_reports'] = len(reports)
-            
-            companies = self.get_reports_by_company()
             stats['companies_count'] = len(companies)
+            stats['high_risk_claims'] = high_risk_claims
             
             # Get latest processing info
-            if os.path.exists(self.processing_log_file):
-                with open(self.processing_log_file, 'r', encoding='utf-8') as f:
-                    processing_log = json.load(f)
-                    if processing_log:
-                        stats['latest_processing'] = processing_log[-1].get('processed_at')
-            
-            # Count high risk claims
-            if os.path.exists(self.processed_claims_file):
-                with open(self.processed_claims_file, 'r', encoding='utf-8') as f:
-                    processed_claims = json.load(f)
-                
-                for claim_data in processed_claims.values():
-                    if claim_data.get('fraud_score', 0) > 0.7:
-                        stats['high_risk_claims'] += 1
+            processing_log = self._processing_log()
+            if processing_log:
+                stats['latest_processing'] = processing_log[-1].get('processed_at')
             
         except Exception as e:
             logger.error(f"Error getting processing stats: {str(e)}")
         
         return stats
     
+    def _processing_log(self) -> List[Dict[str, Any]]:
+        """Processing log entries, oldest first (JSON Lines plus any legacy JSON array)"""
+        entries = _load_json(self.processing_log_file, lambda path: list(iter_jsonl_file(path))) or []
+        legacy = _load_json(self.legacy_processing_log_file)
+        return legacy + entries if legacy else entries
+    
     def get_latest_updates(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get latest system updates"""
         updates = []
         
         try:
-            if os.path.exists(self.processing_log_file):
-                with open(self.processing_log_file, 'r', encoding='utf-8') as f:
-                    processing_log = json.load(f)
-                
-                for log_entry in processing_log[-limit:]:
-                    updates.append({
-                        'type': 'claim_processed',
-                        'message': f"New claim processed: {log_entry.get('subject', 'Unknown')}",
-                        'timestamp': log_entry.get('processed_at'),
-                        'claim_number': log_entry.get('claim_number'),
-                        'company': log_entry.get('sender_email', 'Unknown').split('@')[1].split('.')[0].title() if '@' in log_entry.get('sender_email', '') else 'Unknown'
-                    })
+            processing_log = self._processing_log()
+            
+            for log_entry in processing_log[-limit:]:
+                updates.append({
+                    'type': 'claim_processed',
+                    'message': f"New claim processed: {log_entry.get('subject', 'Unknown')}",
+                    'timestamp': log_entry.get('processed_at'),
+                    'claim_number': log_entry.get('claim_number'),
+                    'company': _company_from_email(log_entry.get('sender_email', ''))
+                })
         
         except Exception as e:
             logger.error(f"Error getting latest updates: {str(e)}")
@@ -186,86 +331,201 @@ class DashboardManager:
             'status': 'online'
         })
         
-        # Sort by timestamp
-        updates.sort(key=lambda x: x['timestamp'], reverse=True)
+        # Sort by timestamp (log entries may lack processed_at; sort those last)
+        updates.sort(key=lambda x: x['timestamp'] or '', reverse=True)
         return updates[:limit]
 
 # Initialize dashboard manager
 dashboard_manager = DashboardManager()
 
-def background_email_processor():
-    """Background thread for continuous email processing"""
-    global processing_pipeline, latest_updates
+def ojsonify(obj: Any):
+    """Serialize an API payload with orjson"""
+    return app.response_class(orjson.dumps(obj, default=str), mimetype='application/json')
+
+def _attachment_disposition(headers, download_name: str):
+    """Set Content-Disposition the way send_file does, adding an RFC 5987 filename* for non-ASCII names"""
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
+    # headers.set quotes and escapes the parameter values
+    headers.set('Content-Disposition', 'attachment', **names)
+
+def _mtime_tag(*paths: str) -> str:
+    """Combine the mtimes of the given paths into an ETag fragment"""
+    parts = []
+    for path in paths:
+        try:
+            parts.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            parts.append('0')
+    return '-'.join(parts)
+
+def _cached_api_response(name: str, etag: str, build):
+    """Serve an API payload from the TTL cache, answering 304 when the client's ETag matches"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        cached = _api_cache.get(name)
+        if cached is None or cached[0] != etag:
+            cached = (etag, build())
+            _api_cache[name] = cached
+        response = ojsonify(cached[1])
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'max-age={API_CACHE_TTL_SECONDS}'
+    return response
+
+def _process_new_emails():
+    """Process unread claim emails and record completed claims as updates"""
+    global processing_pipeline, _updates_version
     
+    if not processing_pipeline:
+        processing_pipeline = ClaimsProcessingPipeline()
+    
+    # Process new emails
+    processed_emails = processing_pipeline.email_processor.process_emails(process_all=False, bulk=settings.IMAP_FETCH_BATCH_SIZE)
+    
+    if processed_emails:
+        logger.info(f"Background processing: Found {len(processed_emails)} new emails")
+        
+        for email_data in processed_emails:
+            try:
+                result = processing_pipeline.process_single_claim(email_data)
+                if result and hasattr(result, 'processing_status') and result.processing_status == 'completed':
+                    # Add to latest updates
+                    update_msg = {
+                        'type': 'new_claim',
+                        'message': f"New claim report generated: {result.claim_number}",
+                        'timestamp': result.processed_at,
+                        'claim_number': result.claim_number,
+                        'company': _company_from_email(result.sender_email),
+                        'fraud_score': result.fraud_score,
+                        'is_duplicate': result.is_duplicate
+                    }
+                    with _updates_lock:
+                        latest_updates.appendleft(update_msg)
+                        _updates_version += 1
+                    
+                    logger.info(f"Background processing completed: {result.claim_number}")
+            except Exception as e:
+                logger.error(f"Error in background processing: {str(e)}")
+
+def background_email_processor():
+    """Background thread processing new emails as IMAP IDLE announces them"""
     logger.info("Background email processor started")
     
+    watcher = MailboxWatcher()
+    use_idle = True
+    pending = True  # Sweep once on start-up
+    
     while not stop_event.is_set():
         try:
-            if not processing_pipeline:
-                processing_pipeline = ClaimsProcessingPipeline()
-            
-            # Process new emails
-            processed_emails = processing_pipeline.email_processor.process_emails(process_all=False)
-            
-            if processed_emails:
-                logger.info(f"Background processing: Found {len(processed_emails)} new emails")
-                
-                for email_data in processed_emails:
-                    try:
-                        result = processing_pipeline.process_single_claim(email_data)
-                        if result and hasattr(result, 'processing_status') and result.processing_status == 'completed':
-                            # Add to latest updates
-                            update_msg = {
-                                'type': 'new_claim',
-                                'message': f"New claim report generated: {result.claim_number}",
-                                'timestamp': result.processed_at,
-                                'claim_number': result.claim_number,
-                                'company': result.sender_email.split('@')[1].split('.')[0].title() if '@' in result.sender_email else 'Unknown',
-                                'fraud_score': result.fraud_score,
-                                'is_duplicate': result.is_duplicate
-                            }
-                            latest_updates.insert(0, update_msg)
-                            # Keep only last 20 updates
-                            latest_updates = latest_updates[:20]
-                            
-                            logger.info(f"Background processing completed: {result.claim_number}")
-                    except Exception as e:
-                        logger.error(f"Error in background processing: {str(e)}")
+            if pending:
+                _process_new_emails()
+                pending = False
             
-            # Wait for next check
-            stop_event.wait(60)  # Check every minute
+            if use_idle:
+                # The wait returns within STOP_CHECK_SECONDS of a stop request, well inside the stop join timeout
+                pending = watcher.wait_for_mail(POLL_CEILING_SECONDS, stop_event)
+            else:
+                stop_event.wait(POLL_CEILING_SECONDS)
+                pending = True
             
+        except IdleUnavailableError:
+            if not watcher.idle_supported:
+                logger.warning("IMAP IDLE not supported, falling back to polling")
+                use_idle = False
+            else:
+                stop_event.wait(POLL_CEILING_SECONDS)  # Retry the IDLE connection later
+            pending = True
+        except (IMAPClientAbortError, imaplib.IMAP4.abort) as e:
+            # Back off so a server that keeps dropping the connection is not hammered with logins
+            delay = watcher.reconnect_delay()
+            logger.warning(f"IDLE connection aborted, reconnecting in {delay}s: {str(e)}")
+            stop_event.wait(delay)
+            pending = True
         except Exception as e:
             logger.error(f"Background processor error: {str(e)}")
-            stop_event.wait(60)  # Wait before retrying
+            stop_event.wait(POLL_CEILING_SECONDS)  # Wait before retrying
+            pending = True
+    
+    watcher.disconnect()
 
 @app.route('/')
 def index():
     """Main dashboard page"""
-    stats = dashboard_manager.get_processing_stats()
-    companies_reports = dashboard_manager.get_reports_by_company()
-    updates = latest_updates or dashboard_manager.get_latest_updates()
+    reports = dashboard_manager.get_all_reports()
+    companies, high_risk_claims = dashboard_manager._group_by_company(reports)
+    stats = dashboard_manager._stats(reports, companies, high_risk_claims)
+    with _updates_lock:
+        updates = list(latest_updates)
+    updates = updates or dashboard_manager.get_latest_updates()
+    
+    # Only the first few reports per company are shown on the overview
+    companies_reports = {company: reports[:3] for company, reports in companies.items()}
+    company_totals = {company: len(reports) for company, reports in companies.items()}
     
     return render_template('index.html', 
                          stats=stats, 
                          companies_reports=companies_reports,
+                         company_totals=company_totals,
                          updates=updates)
 
 @app.route('/reports')
 def reports_list():
     """Reports listing page"""
-    companies_reports = dashboard_manager.get_reports_by_company()
-    return render_template('reports.html', companies_reports=companies_reports)
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', REPORTS_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_REPORTS_PER_PAGE))
+    
+    companies = dashboard_manager.get_reports_by_company()
+    company_totals = {company: len(reports) for company, reports in companies.items()}
+    
+    # Flatten, order newest first and re-group only the requested page
+    all_reports = [report for reports in companies.values() for report in reports]
+    all_reports.sort(key=itemgetter('created_ts'), reverse=True)
+    
+    total_pages = max(1, (len(all_reports) + per_page - 1) // per_page)
+    page = max(1, min(page, total_pages))
+    start = (page - 1) * per_page
+    
+    companies_reports = {}
+    for report in all_reports[start:start + per_page]:
+        companies_reports.setdefault(report['company_name'], []).append(report)
+    
+    return render_template('reports.html',
+                         companies_reports=companies_reports,
+                         company_totals=company_totals,
+                         page=page,
+                         per_page=per_page,
+                         total_pages=total_pages)
 
 @app.route('/download/<filename>')
 def download_report(filename):
     """Download a report file"""
     try:
-        file_path = os.path.join(settings.REPORTS_DIR, filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
+        # Reject names escaping the reports directory (e.g. '../')
+        file_path = safe_join(settings.REPORTS_DIR, filename)
+        if file_path is None:
+            return "File not found", 404
+        try:
+            stat = os.stat(file_path)
+        except (FileNotFoundError, NotADirectoryError):
             return "File not found", 404
+        
+        if settings.DASHBOARD_X_ACCEL_PREFIX:
+            # nginx serves the bytes from its internal location
+            response = app.response_class(mimetype='application/pdf')
+            response.headers['X-Accel-Redirect'] = settings.DASHBOARD_X_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+            _attachment_disposition(response.headers, filename)
+            return response
+        
+        # Conditional responses let browsers revalidate with 304 / use range requests
+        return send_file(file_path, as_attachment=True, conditional=True,
+                         etag=f'{stat.st_mtime_ns}-{stat.st_size}', last_modified=stat.st_mtime)
     except Exception as e:
         logger.error(f"Error downloading file {filename}: {str(e)}")
         return "Error downloading file", 500
@@ -273,14 +533,19 @@ def download_report(filename):
 @app.route('/api/stats')
 def api_stats():
     """API endpoint for statistics"""
-    stats = dashboard_manager.get_processing_stats()
-    return jsonify(stats)
+    etag = _mtime_tag(dashboard_manager.processed_claims_file, dashboard_manager.reports_dir,
+                      dashboard_manager.processing_log_file, dashboard_manager.legacy_processing_log_file)
+    return _cached_api_response('stats', etag, dashboard_manager.get_processing_stats)
 
 @app.route('/api/updates')
 def api_updates():
     """API endpoint for latest updates"""
-    updates = latest_updates or dashboard_manager.get_latest_updates()
-    return jsonify(updates)
+    with _updates_lock:
+        updates = list(latest_updates)
+        version = _updates_version
+    
+    etag = f"{version}-{_mtime_tag(dashboard_manager.processing_log_file, dashboard_manager.legacy_processing_log_file)}"
+    return _cached_api_response('updates', etag, lambda: updates or dashboard_manager.get_latest_updates())
 
 @app.route('/api/process-now', methods=['POST'])
 def api_process_now():
@@ -291,7 +556,7 @@ def api_process_now():
         if not processing_pipeline:
             processing_pipeline = ClaimsProcessingPipeline()
         
-        processed_emails = processing_pipeline.email_processor.process_emails(process_all=False)
+        processed_emails = processing_pipeline.email_processor.process_emails(process_all=False, bulk=settings.IMAP_FETCH_BATCH_SIZE)
         
         if processed_emails:
             results = []
@@ -363,32 +628,19 @@ def format_date(value):
 @app.template_filter('format_size')
 def format_size(value):
     """Format file size for display"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if value < 1024.0:
-            return f"{value:.1f} {unit}"
-        value /= 1024.0
-    return f"{value:.1f} TB"
+    return _format_size(value)
 
 @app.template_filter('risk_color')
 def risk_color(fraud_score):
     """Get color based on fraud risk"""
-    if fraud_score > 0.7:
-        return 'danger'
-    elif fraud_score > 0.4:
-        return 'warning'
-    else:
-        return 'success'
+    return _risk_class(fraud_score)
 
 def start_dashboard(host='0.0.0.0', port=5000, debug=True):
     """Start the Flask dashboard"""
     logger.info(f"Starting Marine Claims Dashboard on {host}:{port}")
-    
-    # Create templates directory if it doesn't exist
-    templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
-    os.makedirs(templates_dir, exist_ok=True)
-    
-    # Create basic templates if they don't exist
-    create_default_templates(templates_dir)
+    settings.ensure_dirs()
+    # Reuse compiled template bytecode across restarts; with no directory Jinja uses a private per-user cache dir
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
     
     try:
         app.run(host=host, port=port, debug=debug, use_reloader=False)
@@ -396,256 +648,5 @@ def start_dashboard(host='0.0.0.0', port=5000, debug=True):
         logger.error(f"Error starting dashboard: {str(e)}")
         raise
 
-def create_default_templates(templates_dir):
-    """Create default HTML templates"""
-    
-    # Main template
-    base_template = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{% block title %}Marine Claims Dashboard{% endblock %}</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    <style>
-        .navbar-brand { font-weight: bold; }
-        .card { margin-bottom: 1rem; }
-        .risk-badge { font-size: 0.8em; }
-        .update-item { border-left: 4px solid #007bff; padding-left: 1rem; margin-bottom: 0.5rem; }
-        .company-section { background: #f8f9fa; padding: 1rem; border-radius: 0.5rem; margin-bottom: 1rem; }
-    </style>
-</head>
-<body>
-    <nav class="navbar navbar-expand-lg navbar-dark bg-primary">
-        <div class="container">
-            <a class="navbar-brand" href="/">
-                <i class="fas fa-ship me-2"></i>Marine Claims Dashboard
-            </a>
-            <div class="navbar-nav">
-                <a class="nav-link text-white" href="/">Dashboard</a>
-                <a class="nav-link text-white" href="/reports">Reports</a>
-            </div>
-        </div>
-    </nav>
-
-    <div class="container mt-4">
-        {% block content %}{% endblock %}
-    </div>
-
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
-    {% block scripts %}{% endblock %}
-</body>
-</html>
-    """
-    
-    # Index template
-    index_template = """
-{% extends "base.html" %}
-
-{% block content %}
-<div class="row">
-    <!-- Statistics -->
-    <div class="col-md-3">
-        <div class="card text-white bg-primary">
-            <div class="card-body">
-                <h5 class="card-title"><i class="fas fa-file-pdf"></i> Total Reports</h5>
-                <h2 class="card-text">{{ stats.total_reports }}</h2>
-            </div>
-        </div>
-    </div>
-    
-    <div class="col-md-3">
-        <div class="card text-white bg-success">
-            <div class="card-body">
-                <h5 class="card-title"><i class="fas fa-building"></i> Companies</h5>
-                <h2 class="card-text">{{ stats.companies_count }}</h2>
-            </div>
-        </div>
-    </div>
-    
-    <div class="col-md-3">
-        <div class="card text-white bg-warning">
-            <div class="card-body">
-                <h5 class="card-title"><i class="fas fa-exclamation-triangle"></i> High Risk</h5>
-                <h2 class="card-text">{{ stats.high_risk_claims }}</h2>
-            </div>
-        </div>
-    </div>
-    
-    <div class="col-md-3">
-        <div class="card text-white bg-info">
-            <div class="card-body">
-                <h5 class="card-title"><i class="fas fa-sync"></i> Last Processed</h5>
-                <h6 class="card-text">{{ stats.latest_processing|format_date if stats.latest_processing else 'Never' }}</h6>
-            </div>
-        </div>
-    </div>
-</div>
-
-<div class="row mt-4">
-    <!-- Latest Updates -->
-    <div class="col-md-6">
-        <div class="card">
-            <div class="card-header">
-                <h5><i class="fas fa-bell"></i> Latest Updates</h5>
-            </div>
-            <div class="card-body">
-                {% for update in updates %}
-                <div class="update-item">
-                    <small class="text-muted">{{ update.timestamp|format_date }}</small>
-                    <div>{{ update.message }}</div>
-                    {% if update.claim_number %}
-                    <small class="text-muted">Claim: {{ update.claim_number }}</small>
-                    {% endif %}
-                </div>
-                {% else %}
-                <p class="text-muted">No recent updates</p>
-                {% endfor %}
-            </div>
-        </div>
-        
-        <div class="card mt-3">
-            <div class="card-header">
-                <h5><i class="fas fa-cogs"></i> System Controls</h5>
-            </div>
-            <div class="card-body">
-                <button id="processNow" class="btn btn-primary btn-sm">
-                    <i class="fas fa-play"></i> Process Now
-                </button>
-                <button id="startBackground" class="btn btn-success btn-sm">
-                    <i class="fas fa-play-circle"></i> Start Background
-                </button>
-                <button id="stopBackground" class="btn btn-danger btn-sm">
-                    <i class="fas fa-stop"></i> Stop Background
-                </button>
-            </div>
-        </div>
-    </div>
-    
-    <!-- Companies Overview -->
-    <div class="col-md-6">
-        <div class="card">
-            <div class="card-header">
-                <h5><i class="fas fa-building"></i> Companies Overview</h5>
-            </div>
-            <div class="card-body">
-                {% for company, reports in companies_reports.items() %}
-                <div class="company-section">
-                    <h6>{{ company }} <span class="badge bg-secondary">{{ reports|length }} reports</span></h6>
-                    {% for report in reports[:3] %}
-                    <div class="d-flex justify-content-between align-items-center small">
-                        <span>{{ report.claim_number }}</span>
-                        <span class="badge bg-{{ report.fraud_score|risk_color }}">
-                            Risk: {{ (report.fraud_score * 100)|int }}%
-                        </span>
-                    </div>
-                    {% endfor %}
-                    {% if reports|length > 3 %}
-                    <small class="text-muted">... and {{ reports|length - 3 }} more</small>
-                    {% endif %}
-                </div>
-                {% else %}
-                <p class="text-muted">No reports available</p>
-                {% endfor %}
-            </div>
-        </div>
-    </div>
-</div>
-{% endblock %}
-
-{% block scripts %}
-<script>
-document.getElementById('processNow').addEventListener('click', function() {
-    fetch('/api/process-now', { method: 'POST' })
-        .then(response => response.json())
-        .then(data => {
-            alert(data.message);
-            location.reload();
-        });
-});
-
-document.getElementById('startBackground').addEventListener('click', function() {
-    fetch('/api/background-process/start', { method: 'POST' })
-        .then(response => response.json())
-        .then(data => alert(data.message));
-});
-
-document.getElementById('stopBackground').addEventListener('click', function() {
-    fetch('/api/background-process/stop', { method: 'POST' })
-        .then(response => response.json())
-        .then(data => alert(data.message));
-});
-</script>
-{% endblock %}
-    """
-    
-    # Reports template
-    reports_template = """
-{% extends "base.html" %}
-
-{% block title %}Reports - Marine Claims Dashboard{% endblock %}
-
-{% block content %}
-<h2><i class="fas fa-file-pdf"></i> Claims Reports</h2>
-
-{% for company, reports in companies_reports.items() %}
-<div class="company-section">
-    <h4>{{ company }} <span class="badge bg-primary">{{ reports|length }} reports</span></h4>
-    
-    <div class="table-responsive">
-        <table class="table table-striped">
-            <thead>
-                <tr>
-                    <th>Claim Number</th>
-                    <th>Subject</th>
-                    <th>Created</th>
-                    <th>Risk Score</th>
-                    <th>Size</th>
-                    <th>Actions</th>
-                </tr>
-            </thead>
-            <tbody>
-                {% for report in reports %}
-                <tr>
-                    <td>{{ report.claim_number }}</td>
-                    <td>{{ report.subject|truncate(50) }}</td>
-                    <td>{{ report.created_at|format_date }}</td>
-                    <td>
-                        <span class="badge bg-{{ report.fraud_score|risk_color }}">
-                            {{ (report.fraud_score * 100)|int }}%
-                        </span>
-                    </td>
-                    <td>{{ report.size|format_size }}</td>
-                    <td>
-                        <a href="{{ report.download_url }}" class="btn btn-primary btn-sm">
-                            <i class="fas fa-download"></i> Download
-                        </a>
-                    </td>
-                </tr>
-                {% endfor %}
-            </tbody>
-        </table>
-    </div>
-</div>
-{% else %}
-<div class="alert alert-info">
-    <i class="fas fa-info-circle"></i> No reports available yet. Process some emails to generate reports.
-</div>
-{% endfor %}
-{% endblock %}
-    """
-    
-    # Write template files
-    with open(os.path.join(templates_dir, 'base.html'), 'w') as f:
-        f.write(base_template)
-    
-    with open(os.path.join(templates_dir, 'index.html'), 'w') as f:
-        f.write(index_template)
-    
-    with open(os.path.join(templates_dir, 'reports.html'), 'w') as f:
-        f.write(reports_template)
-
 if __name__ == '__main__':
     start_dashboard()
\ No newline at end of file
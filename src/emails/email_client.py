@@ -1,36 +1,139 @@
 import imaplib
 import email
-from email.header import decode_header
+import base64
+import datetime
+import quopri
+from email.header import decode_header, make_header
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import os
 import re
+import shutil
+import socket
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from imapclient import IMAPClient
+from imapclient.exceptions import IMAPClientAbortError
+from imapclient.response_parser import parse_fetch_response
+from imapclient.response_types import BodyData
 
 from config.email_config import email_config
+from .imap_pool import imap_pool
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+_HTML_TAG_RE = re.compile(r'<[^<]+?>')
+_BASE64_NOISE_RE = re.compile(rb'[^A-Za-z0-9+/=]')
+_SPOOL_CHUNK_SIZE = 1 << 20
+
+def _imap_id_set(email_ids) -> str:
+    """Render message ids as an IMAP sequence set, collapsing consecutive runs into ranges (1,5,7:12)"""
+    ids = sorted({int(i) for i in email_ids})
+    ranges = []
+    for number in ids:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(str(first) if first == last else f"{first}:{last}" for first, last in ranges)
+
+def _walk_bodystructure(body, prefix: str = ''):
+    """Yield (section, part) for every leaf part of a parsed BODYSTRUCTURE"""
+    if body.is_multipart:
+        for index, part in enumerate(body[0], 1):
+            yield from _walk_bodystructure(part, f"{prefix}.{index}" if prefix else str(index))
+    elif (body[0].upper(), body[1].upper()) == (b'MESSAGE', b'RFC822') and len(body) > 8 and isinstance(body[8], tuple):
+        # A forwarded message carries its own body; a single-part one is numbered <section>.1
+        inner = BodyData.create(body[8])
+        section = prefix or '1'
+        yield from _walk_bodystructure(inner, section if inner.is_multipart else f"{section}.1")
+    else:
+        yield prefix or '1', body
+
+def _part_params(values) -> Dict[str, str]:
+    """Turn a flat (key, value, key, value) parameter list into a dict, decoding RFC 2231 values"""
+    if not values:
+        return {}
+    values = [v.decode('utf-8', errors='ignore') if isinstance(v, bytes) else v for v in values]
+    # decode_params skips its first entry (the header's main value) and joins name*0*, name*1* continuations
+    decoded = email.utils.decode_params([('', '')] + list(zip(values[::2], values[1::2])))[1:]
+    return {key.lower(): email.utils.unquote(email.utils.collapse_rfc2231_value(value)) for key, value in decoded}
+
+def _part_disposition(part):
+    """Return (disposition, params) of a single-part BODYSTRUCTURE entry"""
+    # Extension fields follow the type-specific ones: text/* adds lines, message/rfc822 adds envelope, body and lines
+    main_type = part[0].upper()
+    index = 9 if main_type == b'TEXT' else 11 if (main_type, part[1].upper()) == (b'MESSAGE', b'RFC822') else 8
+    disposition = part[index] if len(part) > index else None
+    if not disposition or not isinstance(disposition, tuple):
+        return '', {}
+    return disposition[0].decode('utf-8', errors='ignore').lower(), _part_params(disposition[1])
+
+def _new_spool_dir(email_id) -> str:
+    """Create a temporary directory holding one email's attachments"""
+    email_id = email_id.decode() if isinstance(email_id, bytes) else email_id
+    return tempfile.mkdtemp(prefix=f'email_{email_id}_')
+
+def _spool_path(spool_dir: str, index: int, filename: str) -> str:
+    # Keep the extension so readers can dispatch on it; the index avoids clashes between equal names
+    return os.path.join(spool_dir, f"{index}{os.path.splitext(filename)[1].lower()}")
+
+def _spool_attachment(spool_dir: str, index: int, filename: str, data: bytes) -> str:
+    """Write an attachment payload to the email's spool directory and return its path"""
+    path = _spool_path(spool_dir, index, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def _spool_encoded_attachment(spool_dir: str, index: int, filename: str, payload: bytes, encoding: str) -> Tuple[str, int]:
+    """Decode a fetched attachment section into the spool directory and return its path and decoded size
+    
+    Base64 is decoded a chunk at a time, so the decoded copy never sits in memory next to the encoded one.
+    """
+    if (encoding or '').upper() != 'BASE64':
+        data = _decode_transfer_encoding(payload, encoding)
+        return _spool_attachment(spool_dir, index, filename, data), len(data)
+    
+    path = _spool_path(spool_dir, index, filename)
+    size = 0
+    pending = b''
+    with open(path, 'wb') as f:
+        for start in range(0, len(payload), _SPOOL_CHUNK_SIZE):
+            # Line breaks split the encoded text anywhere, so carry incomplete 4-character groups over
+            chunk = pending + _BASE64_NOISE_RE.sub(b'', payload[start:start + _SPOOL_CHUNK_SIZE])
+            usable = len(chunk) - len(chunk) % 4
+            size += f.write(base64.b64decode(chunk[:usable]))
+            pending = chunk[usable:]
+        if pending:
+            size += f.write(base64.b64decode(pending))
+    return path, size
+
+def discard_attachments(attachments: List[Dict]):
+    """Remove spooled attachment files (and their spool directory) that were not kept"""
+    for spool_dir in {os.path.dirname(a['path']) for a in attachments if a.get('path')}:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def _decode_transfer_encoding(payload: bytes, encoding: str) -> bytes:
+    """Undo the Content-Transfer-Encoding of a fetched body section"""
+    encoding = (encoding or '').upper()
+    if encoding == 'BASE64':
+        return base64.b64decode(payload)
+    if encoding == 'QUOTED-PRINTABLE':
+        return quopri.decodestring(payload)
+    return payload
+
 class EmailClient:
     def __init__(self):
         self.config = email_config.IMAP_CONFIG
         self.connection = None
         
     def connect(self) -> bool:
-        """Establish connection to email server"""
+        """Establish connection to email server, reusing a pooled session when one is idle"""
         try:
-            logger.info(f"Connecting to {self.config['server']}:{self.config['port']}")
-            self.connection = imaplib.IMAP4_SSL(
-                self.config['server'], 
-                self.config['port']
-            )
-            logger.info("SSL connection established")
-            
-            self.connection.login(
-                self.config['username'], 
-                self.config['password']
-            )
-            logger.info("Successfully logged in to email server")
+            self.connection = imap_pool.acquire(self.config)
             return True
         except imaplib.IMAP4.error as e:
             logger.error(f"IMAP login error: {str(e)}")
@@ -40,14 +143,11 @@ class EmailClient:
             return False
     
     def disconnect(self):
-        """Close connection to email server"""
+        """Hand the connection back to the pool (closing the selected mailbox)"""
         if self.connection:
-            try:
-                self.connection.close()
-                self.connection.logout()
-                logger.info("Disconnected from email server")
-            except Exception as e:
-                logger.error(f"Error disconnecting: {str(e)}")
+            connection, self.connection = self.connection, None
+            imap_pool.release(connection)
+            logger.info("Released email server connection")
     
     def list_folders(self):
         """List all available folders/mailboxes"""
@@ -77,13 +177,17 @@ class EmailClient:
             logger.error(f"Error selecting folder '{folder_name}': {str(e)}")
             return False
     
-    def search_emails(self, criteria: str = 'ALL') -> List[str]:
-        """Search for emails matching criteria"""
+    def search_emails(self, criteria: str = 'ALL', min_uid: int = 0) -> List[str]:
+        """Search for emails matching criteria, optionally only those with UID >= min_uid"""
         try:
             # First select INBOX folder
             if not self.select_folder('INBOX'):
                 return []
             
+            if min_uid:
+                # Lets the server skip everything below the high-water mark instead of rescanning the mailbox
+                criteria = f'(UID {min_uid}:* {criteria})'
+            
             logger.info(f"Searching emails with criteria: {criteria}")
             status, messages = self.connection.search(None, criteria)
             
@@ -114,7 +218,6 @@ class EmailClient:
     def search_recent_emails(self, days: int = 7) -> List[str]:
         """Search for recent emails from last N days"""
         try:
-            import datetime
             date_since = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime('%d-%b-%Y')
             criteria = f'(SINCE "{date_since}")'
             return self.search_emails(criteria)
@@ -123,18 +226,37 @@ class EmailClient:
             return self.search_emails('ALL')  # Fallback to all emails
     
     def fetch_email(self, email_id: str) -> Dict[str, Any]:
-        """Fetch complete email data"""
+        """Fetch complete email data (headers, text body and attachment contents)"""
+        parsed_email = self.fetch_email_lite(email_id)
+        if parsed_email and parsed_email['attachments']:
+            self.load_attachments(email_id, parsed_email['attachments'])
+        return parsed_email
+    
+    def fetch_email_lite(self, email_id: str) -> Dict[str, Any]:
+        """Fetch headers and text body only; attachments are listed by section and downloaded on demand"""
         try:
             logger.debug(f"Fetching email ID: {email_id}")
-            status, msg_data = self.connection.fetch(email_id, '(RFC822)')
+            status, msg_data = self.connection.fetch(email_id, '(BODYSTRUCTURE)')
+            if status != 'OK':
+                logger.error(f"Failed to fetch structure of email {email_id}")
+                return None
+            
+            structure = next(iter(parse_fetch_response(msg_data, False, False).values()))[b'BODYSTRUCTURE']
+            text_parts, attachments = self._classify_parts(structure)
+            
+            # PEEK leaves \Seen untouched; the processor marks emails read itself once handled
+            items = ['BODY.PEEK[HEADER]'] + [f"BODY.PEEK[{part['section']}]" for part in text_parts]
+            status, msg_data = self.connection.fetch(email_id, f"({' '.join(items)})")
             if status != 'OK':
                 logger.error(f"Failed to fetch email {email_id}")
                 return None
             
-            raw_email = msg_data[0][1]
-            email_message = email.message_from_bytes(raw_email)
+            fields = next(iter(parse_fetch_response(msg_data, False, False).values()))
+            email_message = email.message_from_bytes(fields.get(b'BODY[HEADER]') or b'')
             
-            parsed_email = self._parse_email(email_message, email_id)
+            body = self._text_body(fields, text_parts)
+            
+            parsed_email = self._build_email(email_message, email_id, body, attachments)
             logger.info(f"Successfully parsed email: {parsed_email['subject']}")
             return parsed_email
             
@@ -142,160 +264,287 @@ class EmailClient:
             logger.error(f"Error fetching email {email_id}: {str(e)}")
             return None
     
-    def _parse_email(self, email_message, email_id: str) -> Dict[str, Any]:
-        """Parse email message into structured data"""
-        try:
-            # Decode subject
-            subject = "No Subject"
-            if email_message['Subject']:
-                subject_header = decode_header(email_message['Subject'])[0]
-                subject_text, encoding = subject_header
-                if isinstance(subject_text, bytes):
-                    subject = subject_text.decode(encoding if encoding else 'utf-8', errors='ignore')
-                else:
-                    subject = subject_text
-            
-            # Parse sender
-            sender_name, sender_email = email.utils.parseaddr(email_message['From'])
-            if not sender_email:
-                sender_email = email_message['From']
-            
-            # Parse date
-            date = email_message['Date'] or "Unknown"
-            
-            # Get email body
-            body = self._extract_body(email_message)
-            
-            # Get attachments
-            attachments = self._extract_attachments(email_message, email_id)
+    @staticmethod
+    def _text_body(fields: Dict[bytes, Any], text_parts: List[Dict]) -> str:
+        """Decode the fetched text sections into the body: plain text if present, else tag-stripped HTML"""
+        body = ""
+        for part in text_parts:
+            payload = fields.get(f"BODY[{part['section']}]".encode())
+            if not payload:
+                continue
+            raw = _decode_transfer_encoding(payload, part['encoding'])
+            try:
+                text = raw.decode(part['charset'], errors='ignore')
+            except LookupError:
+                # Charsets Python has no codec for (unknown-8bit, x-user-defined, ...)
+                text = raw.decode('utf-8', errors='ignore')
+            if part['subtype'] == 'plain':
+                return text
+            if not body:
+                # Fallback to HTML if no plain text
+                body = _HTML_TAG_RE.sub('', text)
+        return body
+    
+    def _classify_parts(self, structure):
+        """Split BODYSTRUCTURE leaves into inline text parts and attachments"""
+        text_parts = []
+        attachments = []
+        for section, part in _walk_bodystructure(structure):
+            disposition, disposition_params = _part_disposition(part)
+            encoding = part[5].decode('ascii', errors='ignore') if part[5] else ''
             
-            return {
-                'id': email_id.decode() if isinstance(email_id, bytes) else email_id,
-                'subject': subject,
-                'sender_name': sender_name,
-                'sender_email': sender_email,
-                'date': date,
-                'body': body,
-                'attachments': attachments,
-                'body_preview': body[:200] + "..." if len(body) > 200 else body
-            }
+            if disposition == 'attachment':
+                filename = disposition_params.get('filename') or _part_params(part[2]).get('name')
+                if filename:
+                    attachments.append({
+                        'filename': self._decode_header_value(filename),
+                        'section': section,
+                        'encoding': encoding,
+                        'content_type': f"{part[0].decode()}/{part[1].decode()}".lower(),
+                        'size': part[6]  # Encoded size until the content is downloaded
+                    })
+            elif part[0].upper() == b'TEXT' and part[1].upper() in (b'PLAIN', b'HTML'):
+                text_parts.append({
+                    'section': section,
+                    'subtype': part[1].decode().lower(),
+                    'encoding': encoding,
+                    'charset': _part_params(part[2]).get('charset', 'utf-8')
+                })
+        return text_parts, attachments
+    
+    def fetch_attachment(self, email_id: str, section: str, encoding: str = '') -> bytes:
+        """Download and decode a single attachment part by its BODYSTRUCTURE section"""
+        payload = self._fetch_section(email_id, section)
+        if payload is None:
+            return None
+        try:
+            return _decode_transfer_encoding(payload, encoding)
         except Exception as e:
-            logger.error(f"Error parsing email {email_id}: {str(e)}")
-            return {
-                'id': email_id,
-                'subject': 'Error parsing subject',
-                'sender_email': 'Error parsing sender',
-                'date': 'Unknown',
-                'body': '',
-                'attachments': [],
-                'body_preview': 'Error parsing email'
-            }
-    
-    def _extract_body(self, email_message) -> str:
-        """Extract text body from email"""
-        body = ""
+            logger.error(f"Error decoding attachment {section} of email {email_id}: {str(e)}")
+            return None
+    
+    def _fetch_section(self, email_id: str, section: str) -> bytes:
+        """Download a body section as sent, still in its transfer encoding"""
+        try:
+            status, msg_data = self.connection.fetch(email_id, f'(BODY.PEEK[{section}])')
+            if status != 'OK':
+                logger.error(f"Failed to fetch section {section} of email {email_id}")
+                return None
+            fields = next(iter(parse_fetch_response(msg_data, False, False).values()))
+            return fields.get(f"BODY[{section}]".encode()) or b''
+        except Exception as e:
+            logger.error(f"Error fetching attachment {section} of email {email_id}: {str(e)}")
+            return None
+    
+    def load_attachments(self, email_id: str, attachments: List[Dict]) -> List[Dict]:
+        """Download the attachments listed by fetch_email_lite one at a time, spooling each to disk"""
+        pending = [a for a in attachments if 'path' not in a]
+        if not pending:
+            return attachments
         
         try:
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    
-                    # Skip attachments
-                    if "attachment" in content_disposition:
-                        continue
-                    
-                    if content_type == "text/plain":
-                        try:
-                            payload = part.get_payload(decode=True)
-                            if payload:
-                                body = payload.decode('utf-8', errors='ignore')
-                                break
-                        except Exception as e:
-                            logger.warning(f"Error decoding text/plain part: {e}")
-                            continue
-                    elif content_type == "text/html":
-                        # Fallback to HTML if no plain text
-                        if not body:
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    # Basic HTML to text conversion
-                                    html_content = payload.decode('utf-8', errors='ignore')
-                                    # Remove HTML tags
-                                    clean_text = re.sub('<[^<]+?>', '', html_content)
-                                    body = clean_text
-                            except Exception as e:
-                                logger.warning(f"Error decoding text/html part: {e}")
-                                continue
-            else:
-                # Not multipart, just get the payload
+            spool_dir = _new_spool_dir(email_id)
+            for index, attachment in enumerate(pending):
+                payload = self._fetch_section(email_id, attachment['section'])
+                if not payload:
+                    continue
                 try:
-                    payload = email_message.get_payload(decode=True)
-                    if payload:
-                        body = payload.decode('utf-8', errors='ignore')
+                    path, size = _spool_encoded_attachment(spool_dir, index, attachment['filename'],
+                                                           payload, attachment['encoding'])
                 except Exception as e:
-                    logger.warning(f"Error decoding single part email: {e}")
-                    body = email_message.get_payload()
-        
+                    logger.error(f"Error decoding attachment {attachment['section']} of email {email_id}: {str(e)}")
+                    continue
+                finally:
+                    del payload
+                if not size:
+                    os.remove(path)
+                    continue
+                attachment['path'] = path
+                attachment['size'] = size
+                logger.debug(f"Found attachment: {attachment['filename']} ({attachment['size']} bytes)")
+            
+            attachments[:] = [a for a in attachments if a.get('path')]
+            if not os.listdir(spool_dir):
+                os.rmdir(spool_dir)
+            logger.info(f"Extracted {len(attachments)} attachments from email {email_id}")
+            
         except Exception as e:
-            logger.error(f"Error extracting email body: {str(e)}")
+            logger.error(f"Error fetching attachments of email {email_id}: {str(e)}")
         
-        return body if body else "No body content could be extracted"
+        return attachments
     
-    def _extract_attachments(self, email_message, email_id: str) -> List[Dict]:
-        """Extract attachments from email"""
-        attachments = []
+    def fetch_emails(self, email_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch headers and text bodies of several emails in a few FETCH commands, keyed by email ID
+        
+        As with fetch_email_lite, attachments are only listed; load_attachments downloads them
+        once the email has passed the relevance and duplicate checks.
+        """
+        fetched = {}
+        if not email_ids:
+            return fetched
         
         try:
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    content_disposition = str(part.get("Content-Disposition"))
-                    
-                    if "attachment" in content_disposition:
-                        filename = part.get_filename()
-                        if filename:
-                            # Decode filename
-                            filename_header = decode_header(filename)[0]
-                            filename_text, encoding = filename_header
-                            if isinstance(filename_text, bytes):
-                                filename = filename_text.decode(encoding if encoding else 'utf-8', errors='ignore')
-                            else:
-                                filename = filename_text
-                            
-                            attachment_data = part.get_payload(decode=True)
-                            
-                            if attachment_data:
-                                attachments.append({
-                                    'filename': filename,
-                                    'data': attachment_data,
-                                    'content_type': part.get_content_type(),
-                                    'size': len(attachment_data)
-                                })
-                                logger.debug(f"Found attachment: {filename} ({len(attachment_data)} bytes)")
+            logger.debug(f"Bulk fetching {len(email_ids)} emails")
+            status, msg_data = self.connection.fetch(_imap_id_set(email_ids), '(BODYSTRUCTURE BODY.PEEK[HEADER])')
+            if status != 'OK':
+                logger.error(f"Failed to bulk fetch {len(email_ids)} emails")
+                return fetched
             
-            logger.info(f"Extracted {len(attachments)} attachments from email {email_id}")
+            # Text sections differ between messages, so messages with the same ones share a body FETCH
+            parsed = {}
+            groups = {}
+            for seq, fields in parse_fetch_response(msg_data, False, False).items():
+                email_id = str(seq)
+                try:
+                    text_parts, attachments = self._classify_parts(fields[b'BODYSTRUCTURE'])
+                except Exception as e:
+                    logger.error(f"Error parsing structure of email {email_id}: {str(e)}")
+                    continue
+                parsed[email_id] = (fields.get(b'BODY[HEADER]') or b'', text_parts, attachments)
+                groups.setdefault(tuple(part['section'] for part in text_parts), []).append(email_id)
+            del msg_data
+            
+            for sections, group_ids in groups.items():
+                bodies = {}
+                if sections:
+                    items = ' '.join(f"BODY.PEEK[{section}]" for section in sections)
+                    status, msg_data = self.connection.fetch(_imap_id_set(group_ids), f"({items})")
+                    if status != 'OK':
+                        # Left out of the result, so the processor fetches these one at a time
+                        logger.error(f"Failed to bulk fetch bodies of {len(group_ids)} emails")
+                        continue
+                    bodies = parse_fetch_response(msg_data, False, False)
+                for email_id in group_ids:
+                    header, text_parts, attachments = parsed[email_id]
+                    try:
+                        body = self._text_body(bodies.get(int(email_id), {}), text_parts)
+                        fetched[email_id] = self._build_email(email.message_from_bytes(header), email_id,
+                                                              body, attachments)
+                    except Exception as e:
+                        logger.error(f"Error parsing email {email_id}: {str(e)}")
+            
+            logger.info(f"Bulk fetched {len(fetched)}/{len(email_ids)} emails")
             
         except Exception as e:
-            logger.error(f"Error extracting attachments: {str(e)}")
+            logger.error(f"Error bulk fetching emails: {str(e)}")
         
-        return attachments
+        return fetched
+    
+    def fetch_emails_parallel(self, email_ids: List[str], connections: int) -> Dict[str, Dict[str, Any]]:
+        """Split a batch across several IMAP sessions (one per thread) and fetch the slices concurrently"""
+        connections = max(1, min(connections, len(email_ids)))
+        if connections == 1:
+            return self.fetch_emails(email_ids)
+        
+        slices = [email_ids[i::connections] for i in range(connections)]
+        
+        def fetch_slice(slice_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+            # imaplib connections are not thread-safe, so each slice uses its own session
+            client = EmailClient()
+            if not client.connect():
+                return {}
+            try:
+                if not client.select_folder('INBOX'):
+                    return {}
+                return client.fetch_emails(slice_ids)
+            finally:
+                client.disconnect()
+        
+        fetched = {}
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            for result in pool.map(fetch_slice, slices):
+                fetched.update(result)
+        return fetched
+    
+    def _build_email(self, email_message, email_id: str, body: str, attachments: List[Dict]) -> Dict[str, Any]:
+        """Combine decoded headers, body and attachments into the email record"""
+        # Decode subject
+        subject = self._decode_header_value(email_message['Subject']) or "No Subject"
+        
+        # Parse sender
+        sender_name, sender_email = email.utils.parseaddr(email_message['From'])
+        if not sender_email:
+            sender_email = email_message['From']
+        
+        # Parse date
+        date = email_message['Date'] or "Unknown"
+        
+        body = body or "No body content could be extracted"
+        return {
+            'id': email_id.decode() if isinstance(email_id, bytes) else email_id,
+            'subject': subject,
+            'sender_name': sender_name,
+            'sender_email': sender_email,
+            'date': date,
+            'body': body,
+            'attachments': attachments,
+            'body_preview': body[:200] + "..." if len(body) > 200 else body
+        }
+    
+    @staticmethod
+    def _decode_header_value(value: str) -> str:
+        """Decode a header value, joining every RFC 2047 encoded word"""
+        if not value:
+            return ""
+        chunks = decode_header(value)
+        try:
+            return str(make_header(chunks))
+        except (UnicodeDecodeError, LookupError):
+            # make_header is strict; fall back to a lenient per-chunk decode for malformed headers
+            return ''.join(
+                text.decode(encoding or 'utf-8', errors='ignore') if isinstance(text, bytes) else text
+                for text, encoding in chunks
+            )
     
     def mark_as_read(self, email_id: str):
         """Mark email as read"""
-        try:
-            self.connection.store(email_id, '+FLAGS', '\\Seen')
-            logger.debug(f"Marked email {email_id} as read")
-        except Exception as e:
-            logger.error(f"Error marking email as read: {str(e)}")
+        self.mark_many_as_read([email_id])
     
     def mark_as_unread(self, email_id: str):
         """Mark email as unread"""
+        self.mark_many_as_unread([email_id])
+    
+    def mark_many_as_read(self, email_ids: List[str]):
+        """Mark several emails as read with a single STORE command"""
+        self._store_seen_flag(email_ids, '+FLAGS', 'read')
+    
+    def mark_many_as_unread(self, email_ids: List[str]):
+        """Mark several emails as unread with a single STORE command"""
+        self._store_seen_flag(email_ids, '-FLAGS', 'unread')
+    
+    def _store_seen_flag(self, email_ids: List[str], command: str, label: str):
+        """Add or remove \\Seen on a set of messages in one round trip"""
+        if not email_ids:
+            return
+        try:
+            self.connection.store(_imap_id_set(email_ids), command, '\\Seen')
+            logger.debug(f"Marked {len(email_ids)} email(s) as {label}")
+        except Exception as e:
+            logger.error(f"Error marking emails as {label}: {str(e)}")
+    
+    def get_uid_status(self, folder: str = 'INBOX') -> Tuple[int, int]:
+        """Return (UIDVALIDITY, UIDNEXT) for a folder, or (0, 0) if unavailable"""
+        try:
+            result, data = self.connection.status(folder, '(UIDVALIDITY UIDNEXT)')
+            if result == 'OK':
+                validity = re.search(rb'UIDVALIDITY (\d+)', data[0])
+                uid_next = re.search(rb'UIDNEXT (\d+)', data[0])
+                if validity and uid_next:
+                    return int(validity.group(1)), int(uid_next.group(1))
+        except Exception as e:
+            logger.error(f"Error getting UID status: {str(e)}")
+        return 0, 0
+    
+    def get_uids(self, email_ids: List[str]) -> List[int]:
+        """Return the UIDs of the given message sequence numbers, or an empty list if unavailable"""
         try:
-            self.connection.store(email_id, '-FLAGS', '\\Seen')
-            logger.debug(f"Marked email {email_id} as unread")
+            result, data = self.connection.fetch(_imap_id_set(email_ids), '(UID)')
+            if result == 'OK':
+                return [int(match.group(1)) for item in data if isinstance(item, bytes)
+                        for match in [re.search(rb'UID (\d+)', item)] if match]
         except Exception as e:
-            logger.error(f"Error marking email as unread: {str(e)}")
+            logger.error(f"Error getting UIDs: {str(e)}")
+        return []
     
     def get_email_count(self) -> int:
         """Get total number of emails in selected folder"""
@@ -307,4 +556,90 @@ class EmailClient:
             return 0
         except Exception as e:
             logger.error(f"Error getting email count: {str(e)}")
-            return 0
\ No newline at end of file
+            return 0
+
+
+class IdleUnavailableError(Exception):
+    """Raised when the IMAP server cannot be watched with IDLE"""
+
+
+class MailboxWatcher:
+    """Wait for new mail on a folder using IMAP IDLE instead of polling"""
+    
+    # Servers drop IDLE after ~30 minutes, so re-issue it well before that
+    MAX_IDLE_SECONDS = 29 * 60
+    # How often a wait given a stop_event looks at it while staying in the same IDLE command
+    STOP_CHECK_SECONDS = 2
+    # Reconnect delay after consecutive aborted IDLE connections doubles from the first up to the cap
+    RECONNECT_BACKOFF_SECONDS = 2
+    MAX_RECONNECT_BACKOFF_SECONDS = 300
+    
+    def __init__(self, folder: str = 'INBOX'):
+        self.config = email_config.IMAP_CONFIG
+        self.folder = folder
+        self.client = None
+        self.idle_supported = True
+        self._aborts = 0  # Consecutive aborted waits; reset by the next successful one
+    
+    def connect(self) -> bool:
+        """Open a dedicated IDLE connection and select the watched folder"""
+        try:
+            self.client = IMAPClient(self.config['server'], port=self.config['port'], ssl=True)
+            self.client.login(self.config['username'], self.config['password'])
+            self.client.select_folder(self.folder, readonly=True)
+            
+            if not self.client.has_capability('IDLE'):
+                logger.warning("IMAP server does not support IDLE")
+                self.idle_supported = False
+                self.disconnect()
+                return False
+            
+            logger.info(f"IDLE watcher connected to '{self.folder}'")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to start IDLE watcher: {str(e)}")
+            self.client = None
+            return False
+    
+    def disconnect(self):
+        """Close the IDLE connection"""
+        if self.client:
+            try:
+                self.client.logout()
+            except Exception as e:
+                logger.debug(f"Error closing IDLE connection: {str(e)}")
+            self.client = None
+    
+    def wait_for_mail(self, timeout: float, stop_event=None) -> bool:
+        """Block in IDLE for up to timeout seconds, or until stop_event is set; True when new mail was announced"""
+        if not self.client and not self.connect():
+            raise IdleUnavailableError("IDLE connection unavailable")
+        
+        deadline = time.monotonic() + min(timeout, self.MAX_IDLE_SECONDS)
+        responses = []
+        try:
+            self.client.idle()
+            try:
+                # Short idle_check calls keep the one IDLE command open while still noticing a stop request
+                while not responses and not (stop_event is not None and stop_event.is_set()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    step = remaining if stop_event is None else min(remaining, self.STOP_CHECK_SECONDS)
+                    responses = self.client.idle_check(timeout=step)
+            finally:
+                self.client.idle_done()
+        except (IMAPClientAbortError, imaplib.IMAP4.abort, socket.error):
+            # Connection dropped; reconnect on the next wait
+            self.disconnect()
+            self._aborts += 1
+            raise
+        
+        self._aborts = 0
+        return any(len(response) > 1 and response[1] in (b'EXISTS', b'RECENT') for response in responses)
+    
+    def reconnect_delay(self) -> float:
+        """Seconds to wait before reconnecting after the current run of aborted waits"""
+        if not self._aborts:
+            return 0
+        return min(self.RECONNECT_BACKOFF_SECONDS * 2 ** (self._aborts - 1), self.MAX_RECONNECT_BACKOFF_SECONDS)
@@ -1,48 +1,117 @@
 import os
+import re
 import json
 import logging
 from datetime import datetime
 from typing import List, Dict, Any
 import hashlib
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from config.settings import settings
 from config.email_config import email_config
-from .email_client import EmailClient
+from .email_client import EmailClient, discard_attachments
 from storage.file_manager import FileManager
 from pdf_compilation.pdf_compiler import PDFCompiler
 from utils.logger import setup_logger
+from utils.helpers import read_json_file, write_json_file, append_jsonl_file, iter_jsonl_file, file_lock
 
 logger = setup_logger(__name__)
 
+# Registry entries written with the blake2b field-hash fingerprint carry this version
+EMAIL_FINGERPRINT_VERSION = 2
+
+# Processed emails between registry/log flushes within a run, bounding what a crash can lose
+FLUSH_INTERVAL = 50
+
+# Anything but letters, digits (\w, Unicode-aware like str.isalnum, plus '_'), space, '-' and '.'
+_FILENAME_UNSAFE_RE = re.compile(r'[^\w .-]')
+
+# Returned by _process_email_task when an email could not be handled (as opposed to skipped)
+_FAILED = object()
+
 class EmailProcessor:
     def __init__(self):
+        settings.ensure_dirs()
         self.email_client = EmailClient()
         self.file_manager = FileManager()
         self.pdf_compiler = PDFCompiler()
         self.filter_criteria = email_config.FILTER_CRITERIA
+        # Relevance filters prepared once: lower-cased senders and one case-insensitive keyword scanner.
+        # Blank sender entries are dropped, as in the search; '' would otherwise match every address
+        self._target_senders = tuple(s.strip().lower() for s in self.filter_criteria['senders'] if s.strip())
+        keywords = self.filter_criteria['keywords']
+        self._keyword_re = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE) if keywords else None
         self.processed_emails_file = os.path.join(settings.PROCESSED_CLAIMS_DIR, 'processed_emails.json')
+        self._registry_mtime = None  # mtime_ns of the registry file as last read or written by this process
         self.processed_emails = self._load_processed_emails()
+        # Entries keyed by the older JSON+MD5 fingerprint still need the legacy digest to be recognized
+        self._has_legacy_fingerprints = any(
+            not isinstance(entry, dict) or 'fingerprint_version' not in entry
+            for entry in self.processed_emails.values()
+        )
+        # UID high-water mark: messages up to this UID were covered by a completed run
+        self._synced_uid = 0
+        self._sync_validity = None
+        # Registry changes and log entries are buffered and written once per batch of emails
+        self._dirty = False
+        self._pending_log = []
+        # Worker threads share the registry; each gets its own IMAP session when it needs one
+        self._state_lock = threading.Lock()
+        self._in_flight = set()
+        self._local = threading.local()
+        self._worker_clients = []
     
     def _load_processed_emails(self) -> Dict[str, Any]:
         """Load previously processed emails to avoid duplication"""
         try:
             if os.path.exists(self.processed_emails_file):
-                with open(self.processed_emails_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                self._registry_mtime = os.stat(self.processed_emails_file).st_mtime_ns
+                return read_json_file(self.processed_emails_file)
         except Exception as e:
             logger.error(f"Error loading processed emails: {str(e)}")
         return {}
     
     def _save_processed_emails(self):
-        """Save processed emails registry"""
+        """Save processed emails registry, merging in entries another process saved since we last looked"""
         try:
-            with open(self.processed_emails_file, 'w', encoding='utf-8') as f:
-                json.dump(self.processed_emails, f, indent=2, ensure_ascii=False)
+            with file_lock(self.processed_emails_file + '.lock'):
+                try:
+                    mtime = os.stat(self.processed_emails_file).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                if mtime is not None and mtime != self._registry_mtime:
+                    for fingerprint, entry in read_json_file(self.processed_emails_file).items():
+                        self.processed_emails.setdefault(fingerprint, entry)
+                write_json_file(self.processed_emails_file, self.processed_emails)
+                self._registry_mtime = os.stat(self.processed_emails_file).st_mtime_ns
         except Exception as e:
             logger.error(f"Error saving processed emails: {str(e)}")
     
     def _get_email_fingerprint(self, email_data: Dict[str, Any]) -> str:
-        """Create a unique fingerprint for each email to avoid duplicates"""
+        """Create a unique fingerprint for each email to avoid duplicates (memoized on the email dict)"""
+        fingerprint = email_data.get('_fp')
+        if fingerprint is not None:
+            return fingerprint
+        
+        # Feed the fields straight into the hasher, NUL-separated so field boundaries can't shift
+        hasher = hashlib.blake2b(digest_size=16)
+        for field in (
+            email_data.get('subject') or '',
+            email_data.get('sender_email') or '',
+            (email_data.get('body_preview') or '')[:200],
+            str(len(email_data.get('attachments', [])))
+        ):
+            hasher.update(field.encode('utf-8', errors='surrogatepass'))
+            hasher.update(b'\0')
+        
+        # Computed before attachments are downloaded, so the check and the later mark always agree
+        email_data['_fp'] = hasher.hexdigest()
+        return email_data['_fp']
+    
+    def _get_legacy_email_fingerprint(self, email_data: Dict[str, Any]) -> str:
+        """Fingerprint used by registry entries written before EMAIL_FINGERPRINT_VERSION 2"""
         fingerprint_data = {
             'subject': email_data.get('subject', ''),
             'sender_email': email_data.get('sender_email', ''),
@@ -54,24 +123,65 @@ class EmailProcessor:
     
     def _is_email_processed(self, email_data: Dict[str, Any]) -> bool:
         """Check if email has already been processed"""
-        email_fingerprint = self._get_email_fingerprint(email_data)
-        return email_fingerprint in self.processed_emails
+        if self._get_email_fingerprint(email_data) in self.processed_emails:
+            return True
+        return self._has_legacy_fingerprints and self._get_legacy_email_fingerprint(email_data) in self.processed_emails
     
     def _mark_email_processed(self, email_data: Dict[str, Any], result: Dict[str, Any]):
         """Mark email as processed"""
         email_fingerprint = self._get_email_fingerprint(email_data)
-        self.processed_emails[email_fingerprint] = {
-            'email_id': email_data.get('id'),
-            'subject': email_data.get('subject'),
-            'sender_email': email_data.get('sender_email'),
-            'processed_at': datetime.now().isoformat(),
-            'claim_number': result.get('claim_number', 'Unknown'),
-            'pdf_path': result.get('pdf_path', '')
-        }
-        self._save_processed_emails()
+        with self._state_lock:
+            self.processed_emails[email_fingerprint] = {
+                'email_id': email_data.get('id'),
+                'subject': email_data.get('subject'),
+                'sender_email': email_data.get('sender_email'),
+                'processed_at': datetime.now().isoformat(),
+                'claim_number': result.get('claim_number', 'Unknown'),
+                'pdf_path': result.get('pdf_path', ''),
+                'fingerprint_version': EMAIL_FINGERPRINT_VERSION
+            }
+            self._dirty = True
+    
+    def _flush(self):
+        """Write buffered registry changes and processing log entries to disk"""
+        with self._state_lock:
+            if self._dirty:
+                self._save_processed_emails()
+                self._dirty = False
+            if self._pending_log:
+                self._write_processing_log(self._pending_log)
+                self._pending_log = []
+    
+    def _thread_client(self) -> EmailClient:
+        """IMAP session owned by the calling worker thread (imaplib connections are not thread-safe)"""
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = EmailClient()
+            if not client.connect() or not client.select_folder('INBOX'):
+                raise ConnectionError("Worker could not open an IMAP session")
+            self._local.client = client
+            with self._state_lock:
+                self._worker_clients.append(client)
+        return client
+    
+    def _close_worker_clients(self):
+        """Log out every worker IMAP session opened during a run"""
+        with self._state_lock:
+            clients, self._worker_clients = self._worker_clients, []
+        for client in clients:
+            client.disconnect()
+        self._local = threading.local()
     
-    def process_emails(self, process_all: bool = False) -> List[Dict[str, Any]]:
-        """Main method to process all relevant emails from multiple senders"""
+    def process_emails(self, process_all: bool = False, bulk: int = None,
+                       max_workers: int = None, max_emails: int = None) -> List[Dict[str, Any]]:
+        """Main method to process all relevant emails from multiple senders
+        
+        bulk sets how many messages are retrieved per IMAP FETCH (defaults to
+        settings.IMAP_FETCH_BATCH_SIZE; 1 fetches messages one at a time).
+        max_workers sets how many emails are processed concurrently (defaults to
+        settings.EMAIL_PROCESS_WORKERS; 1 processes them serially).
+        max_emails caps the emails handled in this run (defaults to settings.MAX_EMAILS_PER_RUN).
+        """
         logger.info("Starting comprehensive email processing...")
         
         if not self.email_client.connect():
@@ -83,27 +193,83 @@ class EmailProcessor:
                 logger.error("Failed to select INBOX folder")
                 return []
             
+            # Only search messages that arrived since the last completed run; a UIDVALIDITY change resets the mark
+            uid_validity, uid_next = self.email_client.get_uid_status()
+            min_uid = 0
+            if not process_all and uid_next and uid_validity == self._sync_validity:
+                if uid_next - 1 <= self._synced_uid:
+                    logger.info("No new emails since last run")
+                    return []
+                min_uid = self._synced_uid + 1
+            
             # Get emails from all target senders
-            all_email_ids = self._get_emails_from_all_senders(process_all)
+            all_email_ids = self._get_emails_from_all_senders(process_all, min_uid)
             
             if not all_email_ids:
                 logger.info("No emails found from any target sender")
+                self._advance_sync_mark(uid_validity, uid_next)
                 return []
             
             # Remove duplicates and sort
-            unique_email_ids = list(set(all_email_ids))
-            unique_email_ids.sort()  # Process in order
+            unique_email_ids = sorted(set(all_email_ids))  # Process in order
+            
+            if bulk is None:
+                bulk = settings.IMAP_FETCH_BATCH_SIZE
+            bulk = max(1, bulk)
             
+            if max_emails is None:
+                max_emails = settings.MAX_EMAILS_PER_RUN
+            email_ids = unique_email_ids[:max_emails]
             processed_emails = []
-            for i, email_id in enumerate(unique_email_ids[:settings.MAX_EMAILS_PER_RUN]):
-                try:
-                    logger.info(f"Processing email {i+1}/{len(unique_email_ids)}")
-                    processed_email = self._process_single_email(email_id)
-                    if processed_email:
-                        processed_emails.append(processed_email)
-                except Exception as e:
-                    logger.error(f"Error processing email {email_id}: {str(e)}")
-                    continue
+            failed_ids = []
+            
+            # Saving, PDF compilation and attachment downloads overlap across worker threads
+            if max_workers is None:
+                max_workers = settings.EMAIL_PROCESS_WORKERS
+            workers = min(max_workers, len(email_ids))
+            pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                for start in range(0, len(email_ids), bulk):
+                    batch = email_ids[start:start + bulk]
+                    # Headers and text bodies for the whole batch in a few round trips; attachments come later, per email
+                    prefetched = {}
+                    if bulk > 1:
+                        prefetched = self.email_client.fetch_emails_parallel(batch, settings.IMAP_FETCH_CONNECTIONS)
+                    
+                    tasks = [
+                        (i, len(unique_email_ids), email_id,
+                         prefetched.get(email_id.decode() if isinstance(email_id, bytes) else str(email_id)),
+                         pool is not None)
+                        for i, email_id in enumerate(batch, start + 1)
+                    ]
+                    if pool is not None:
+                        results = pool.map(lambda task: self._process_email_task(*task), tasks)
+                    else:
+                        results = (self._process_email_task(*task) for task in tasks)
+                    
+                    handled_ids = []
+                    for email_id, processed_email in zip(batch, results):
+                        if processed_email is _FAILED:
+                            failed_ids.append(email_id)
+                        elif processed_email:
+                            processed_emails.append(processed_email)
+                            handled_ids.append(email_id)
+                            if len(processed_emails) % FLUSH_INTERVAL == 0:
+                                self._flush()
+                    
+                    # One STORE per batch instead of one per processed message
+                    self.email_client.mark_many_as_read(handled_ids)
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+            
+            # Messages beyond the per-run limit are still pending, so only a complete run moves the mark
+            if len(unique_email_ids) <= max_emails:
+                if failed_ids:
+                    # Failed emails stay unread; keep the mark below the first of them so later runs retry it
+                    failed_uids = self.email_client.get_uids(failed_ids)
+                    uid_next = min(failed_uids) if len(failed_uids) == len(failed_ids) else 0
+                self._advance_sync_mark(uid_validity, uid_next)
             
             return processed_emails
             
@@ -111,67 +277,109 @@ class EmailProcessor:
             logger.error(f"Error during email processing: {str(e)}")
             return []
         finally:
+            self._flush()
+            self._in_flight.clear()
+            self._close_worker_clients()
             self.email_client.disconnect()
     
-    def _get_emails_from_all_senders(self, process_all: bool) -> List[str]:
-        """Get emails from all target senders"""
-        all_email_ids = []
+    def _advance_sync_mark(self, uid_validity: int, uid_next: int):
+        """Record that every message below uid_next has been looked at (0 leaves the mark alone)"""
+        if uid_next:
+            self._synced_uid = uid_next - 1
+            self._sync_validity = uid_validity
+    
+    def _get_emails_from_all_senders(self, process_all: bool, min_uid: int = 0) -> List[str]:
+        """Get emails from all target senders with one SEARCH, skipping UIDs below min_uid when set"""
+        senders = [sender.strip() for sender in self.filter_criteria['senders'] if sender.strip()]
+        if not senders:
+            return []
         
-        for sender in self.filter_criteria['senders']:
-            sender = sender.strip()  # Clean whitespace
-            if not sender:
-                continue
-                
-            logger.info(f"Searching for emails from sender: {sender}")
-            
-            if process_all:
-                # Search for all emails from this sender
-                criteria = f'(FROM "{sender}")'
-            else:
-                # Search for unread emails from this sender
-                criteria = f'(UNSEEN FROM "{sender}")'
-                
-            email_ids = self.email_client.search_emails(criteria)
-            
-            # If no unread emails found and we're not processing all, try all emails from sender
-            if not email_ids and not process_all:
-                criteria = f'(FROM "{sender}")'
-                email_ids = self.email_client.search_emails(criteria)
+        logger.info(f"Searching for emails from senders: {', '.join(senders)}")
+        from_keys = self._build_from_criteria(senders)
+        
+        if process_all:
+            # Search for all emails from these senders
+            email_ids = self.email_client.search_emails(f'({from_keys})', min_uid)
+        else:
+            # Search for unread emails from these senders
+            email_ids = self.email_client.search_emails(f'(UNSEEN {from_keys})', min_uid)
             
-            if email_ids:
-                logger.info(f"Found {len(email_ids)} emails from {sender}")
-                all_email_ids.extend(email_ids)
-            else:
-                logger.info(f"No emails found from {sender}")
+            # If no unread emails found, try all emails from the senders
+            if not email_ids:
+                email_ids = self.email_client.search_emails(f'({from_keys})', min_uid)
         
-        return all_email_ids
+        if email_ids:
+            logger.info(f"Found {len(email_ids)} emails from target senders")
+        else:
+            logger.info("No emails found from target senders")
+        return email_ids
     
-    def _process_single_email(self, email_id: str) -> Dict[str, Any]:
-        """Process a single email with comprehensive document extraction"""
-        # Fetch email data
-        email_data = self.email_client.fetch_email(email_id)
+    @staticmethod
+    def _build_from_criteria(senders: List[str]) -> str:
+        """Match any of the senders: OR takes two keys, so N senders need N-1 prefixed ORs"""
+        return 'OR ' * (len(senders) - 1) + ' '.join(f'FROM "{sender}"' for sender in senders)
+    
+    def _process_email_task(self, position: int, total: int, email_id: str, email_data: Dict[str, Any],
+                            in_worker: bool) -> Dict[str, Any]:
+        """Process one email of a batch, logging instead of raising so the batch carries on
+        
+        Returns the processed email, None for emails skipped as irrelevant or duplicate, or _FAILED.
+        """
+        try:
+            logger.info(f"Processing email {position}/{total}")
+            client = None
+            # Worker threads only open their own IMAP session if the email still has something to download
+            if in_worker and (email_data is None or any('path' not in a for a in email_data['attachments'])):
+                client = self._thread_client()
+            return self._process_single_email(email_id, email_data, batched=True, client=client)
+        except Exception as e:
+            logger.error(f"Error processing email {email_id}: {str(e)}")
+            return _FAILED
+    
+    def _process_single_email(self, email_id: str, email_data: Dict[str, Any] = None, batched: bool = False,
+                              client: EmailClient = None) -> Dict[str, Any]:
+        """Process a single email with comprehensive document extraction
+        
+        Batched callers mark emails read and flush the registry themselves;
+        client overrides the processor's own IMAP session (one per worker thread).
+        """
+        client = client or self.email_client
+        
+        # Fetch headers and body only unless it was already bulk fetched; attachments follow once the email qualifies
+        if email_data is None:
+            email_data = client.fetch_email_lite(email_id)
         if not email_data:
-            return None
+            raise RuntimeError(f"Could not fetch email {email_id}")
         
         # Check if email matches our criteria (from any target sender)
         if not self._is_relevant_email(email_data):
+            discard_attachments(email_data['attachments'])
             return None
         
-        # Check if email has already been processed
-        if self._is_email_processed(email_data):
+        # Check if email has already been processed, or is being processed by another worker this run
+        fingerprint = self._get_email_fingerprint(email_data)
+        with self._state_lock:
+            already_processed = self._is_email_processed(email_data) or fingerprint in self._in_flight
+            if not already_processed:
+                self._in_flight.add(fingerprint)
+        if already_processed:
             logger.info(f"Email already processed: {email_data['subject']}")
+            discard_attachments(email_data['attachments'])
             return None
         
         logger.info(f"Processing relevant email: {email_data['subject']}")
         
+        client.load_attachments(email_id, email_data['attachments'])
+        
         # Save email and attachments
         saved_paths = self._save_email_data(email_data)
         
         # Compile to PDF with full content extraction
         pdf_path = self._compile_comprehensive_pdf(email_data, saved_paths)
         
-        # Mark as read
-        self.email_client.mark_as_read(email_id)
+        # Mark as read (batch callers flag their processed emails together instead)
+        if not batched:
+            client.mark_as_read(email_id)
         
         # Create processing record
         processed_email = {
@@ -188,6 +396,8 @@ class EmailProcessor:
         
         # Save processing metadata
         self._save_processing_metadata(processed_email)
+        if not batched:
+            self._flush()
         
         logger.info(f"Successfully processed email {email_id} with full content extraction")
         return processed_email
@@ -211,22 +421,15 @@ class EmailProcessor:
     def _is_relevant_email(self, email_data: Dict[str, Any]) -> bool:
         """Check if email matches our processing criteria (any target sender)"""
         sender_email = email_data['sender_email'].lower()
-        subject = email_data['subject'].lower()
-        body = email_data['body'].lower()
         
         # Check if sender is in our target senders list
-        target_senders = [s.strip().lower() for s in self.filter_criteria['senders']]
-        sender_match = any(target_sender in sender_email for target_sender in target_senders)
-        
-        if not sender_match:
+        if not any(target_sender in sender_email for target_sender in self._target_senders):
             return False
         
-        # Check for keywords in subject or body
-        keywords = [k.lower() for k in self.filter_criteria['keywords']]
-        subject_contains_keyword = any(keyword in subject for keyword in keywords)
-        body_contains_keyword = any(keyword in body for keyword in keywords)
-        
-        return subject_contains_keyword or body_contains_keyword
+        # Check for keywords in subject or body; one regex pass each, without lower-casing the body
+        if self._keyword_re is None:
+            return False
+        return bool(self._keyword_re.search(email_data['subject']) or self._keyword_re.search(email_data['body']))
     
     def _save_email_data(self, email_data: Dict[str, Any]) -> Dict[str, str]:
         """Save email and attachments to file system"""
@@ -258,8 +461,7 @@ class EmailProcessor:
                 'body_preview': email_data['body_preview']
             }
             
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            write_json_file(metadata_path, metadata)
             
             saved_paths['email_metadata'] = metadata_path
             
@@ -272,56 +474,65 @@ class EmailProcessor:
             
             # Save attachments
             for attachment in email_data['attachments']:
-                clean_filename = "".join(c for c in attachment['filename'] if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
+                clean_filename = _FILENAME_UNSAFE_RE.sub('', attachment['filename']).rstrip()
                 attachment_path = os.path.join(email_base_path, clean_filename)
                 
-                with open(attachment_path, 'wb') as f:
-                    f.write(attachment['data'])
+                # Attachments were spooled to a temp dir while fetching; move them into place,
+                # sharing one stored copy between emails that forward the same file
+                digest = None
+                if settings.ATTACHMENT_DEDUP_ENABLED:
+                    digest = self.file_manager.store_deduplicated(attachment['path'], attachment_path)
+                else:
+                    shutil.move(attachment['path'], attachment_path)
                 
                 saved_paths['attachments'].append({
                     'original_filename': attachment['filename'],
                     'saved_filename': clean_filename,
                     'path': attachment_path,
                     'size': attachment['size'],
-                    'content_type': attachment['content_type']
+                    'content_type': attachment['content_type'],
+                    'sha256': digest
                 })
             
         except Exception as e:
             logger.error(f"Error saving email data: {str(e)}")
+        finally:
+            discard_attachments(email_data['attachments'])
         
         return saved_paths
     
     def _save_processing_metadata(self, processed_email: Dict[str, Any]):
-        """Save processing metadata to central log"""
+        """Queue processing metadata for the central log"""
+        entry = {
+            'email_id': processed_email['id'],
+            'claim_number': processed_email['claim_number'],
+            'subject': processed_email['subject'],
+            'sender_email': processed_email['sender_email'],
+            'processed_at': processed_email['processed_at'],
+            'attachment_count': len(processed_email['attachments']),
+            'pdf_path': processed_email['pdf_path'],
+            'saved_folder': processed_email['saved_paths']['email_folder'],
+            'processing_status': processed_email['processing_status']
+        }
+        with self._state_lock:
+            self._pending_log.append(entry)
+    
+    def _write_processing_log(self, log_entries: List[Dict[str, Any]]):
+        """Append entries to the central processing log (JSON Lines, one entry per line)"""
         try:
-            log_file = os.path.join(settings.REPORTS_DIR, 'processing_log.json')
-            
-            if os.path.exists(log_file):
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    log_data = json.load(f)
-            else:
-                log_data = []
-            
-            log_entry = {
-                'email_id': processed_email['id'],
-                'claim_number': processed_email['claim_number'],
-                'subject': processed_email['subject'],
-                'sender_email': processed_email['sender_email'],
-                'processed_at': processed_email['processed_at'],
-                'attachment_count': len(processed_email['attachments']),
-                'pdf_path': processed_email['pdf_path'],
-                'saved_folder': processed_email['saved_paths']['email_folder'],
-                'processing_status': processed_email['processing_status']
-            }
-            
-            log_data.append(log_entry)
-            
-            with open(log_file, 'w', encoding='utf-8') as f:
-                json.dump(log_data, f, indent=2, ensure_ascii=False)
-                
+            append_jsonl_file(os.path.join(settings.REPORTS_DIR, 'processing_log.jsonl'), log_entries)
         except Exception as e:
             logger.error(f"Error saving processing metadata: {str(e)}")
     
+    def _load_processing_log(self):
+        """Yield processing log entries, oldest first, including any legacy processing_log.json array"""
+        legacy_file = os.path.join(settings.REPORTS_DIR, 'processing_log.json')
+        if os.path.exists(legacy_file):
+            yield from read_json_file(legacy_file)
+        log_file = os.path.join(settings.REPORTS_DIR, 'processing_log.jsonl')
+        if os.path.exists(log_file):
+            yield from iter_jsonl_file(log_file)
+    
     def test_connection(self) -> bool:
         """Test email server connection"""
         try:
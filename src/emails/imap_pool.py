@@ -0,0 +1,127 @@
+import atexit
+import imaplib
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from config.settings import settings
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class ImapConnectionPool:
+    """Logged-in IMAP sessions kept between runs, each lent to one EmailClient at a time
+
+    imaplib connections are not thread-safe, so a session is never shared while checked out;
+    pooling only saves the TLS handshake and LOGIN of every connect().
+    """
+
+    def __init__(self, max_idle: int = None, keepalive_seconds: float = None):
+        self.max_idle = settings.IMAP_POOL_SIZE if max_idle is None else max_idle
+        self.keepalive_seconds = settings.IMAP_KEEPALIVE_SECONDS if keepalive_seconds is None else keepalive_seconds
+        self._idle: Dict[Tuple[str, int, str], List[Tuple[imaplib.IMAP4_SSL, float]]] = {}
+        self._keys: Dict[int, Tuple[str, int, str]] = {}  # id(connection) -> pool key
+        self._lock = threading.Lock()
+        self._keepalive_thread = None
+
+    def acquire(self, config: Dict[str, Any]) -> imaplib.IMAP4_SSL:
+        """Return a live authenticated session for the account, logging in only if none is idle"""
+        key = (config['server'], config['port'], config['username'])
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                connection, _ = idle.pop()
+            # The server may have dropped the session while it sat in the pool; NOOP is one round trip
+            if self._is_alive(connection):
+                logger.debug("Reusing pooled IMAP connection")
+                return connection
+            self._discard(connection)
+
+        logger.info(f"Connecting to {config['server']}:{config['port']}")
+        connection = imaplib.IMAP4_SSL(config['server'], config['port'])
+        logger.info("SSL connection established")
+        connection.login(config['username'], config['password'])
+        logger.info("Successfully logged in to email server")
+        with self._lock:
+            self._keys[id(connection)] = key
+        return connection
+
+    def release(self, connection: imaplib.IMAP4_SSL):
+        """Take a session back, closing its mailbox; sessions beyond max_idle are logged out"""
+        try:
+            if connection.state == 'SELECTED':
+                connection.close()
+        except Exception as e:
+            logger.debug(f"Dropping IMAP connection that failed to close its mailbox: {str(e)}")
+            self._discard(connection)
+            return
+
+        with self._lock:
+            key = self._keys.get(id(connection))
+            idle = self._idle.setdefault(key, []) if key is not None else None
+            keep = idle is not None and len(idle) < self.max_idle
+            if keep:
+                idle.append((connection, time.monotonic()))
+        if keep:
+            self._start_keepalive()
+        else:
+            self._discard(connection)
+
+    def close_all(self):
+        """Log out every idle session"""
+        with self._lock:
+            connections = [connection for idle in self._idle.values() for connection, _ in idle]
+            self._idle.clear()
+        for connection in connections:
+            self._discard(connection)
+
+    def _discard(self, connection: imaplib.IMAP4_SSL):
+        """Forget a session and log it out, ignoring a connection that is already gone"""
+        with self._lock:
+            self._keys.pop(id(connection), None)
+        try:
+            connection.logout()
+        except Exception as e:
+            logger.debug(f"Error logging out pooled IMAP connection: {str(e)}")
+
+    @staticmethod
+    def _is_alive(connection: imaplib.IMAP4_SSL) -> bool:
+        try:
+            return connection.noop()[0] == 'OK'
+        except Exception:
+            return False
+
+    def _start_keepalive(self):
+        """Start the daemon thread that keeps idle sessions under the server's inactivity timeout"""
+        with self._lock:
+            if self._keepalive_thread is not None or self.keepalive_seconds <= 0:
+                return
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name='imap-keepalive', daemon=True)
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        # Waking every half interval bounds the silence on any idle session to keepalive_seconds
+        half = self.keepalive_seconds / 2
+        while True:
+            time.sleep(half)
+            now = time.monotonic()
+            # Sessions are taken out of the pool while pinged, so no caller can be handed one mid-NOOP
+            with self._lock:
+                due = {}
+                for key, idle in self._idle.items():
+                    due[key] = [item for item in idle if now - item[1] >= half]
+                    idle[:] = [item for item in idle if now - item[1] < half]
+            for key, items in due.items():
+                for connection, _ in items:
+                    if self._is_alive(connection):
+                        with self._lock:
+                            self._idle.setdefault(key, []).append((connection, time.monotonic()))
+                    else:
+                        logger.info("Dropping idle IMAP connection closed by the server")
+                        self._discard(connection)
+
+
+imap_pool = ImapConnectionPool()
+atexit.register(imap_pool.close_all)
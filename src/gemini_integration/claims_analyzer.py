@@ -1,8 +1,10 @@
 import os
 import json
 import logging
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, List, Tuple
 import google.generativeai as genai
+import orjson
 
 from config.settings import settings
 from .gemini_client import GeminiClient
@@ -11,6 +13,36 @@ from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Prompt budget for one batched request, estimated at ~4 characters per token
+MAX_BATCH_TOKENS = 30000
+CHARS_PER_TOKEN = 4
+
+# Prompt pieces built once; only the per-claim section is formatted per call
+_ANALYSIS_PROMPT_HEAD = f"""
+        {CLAIM_ANALYSIS_PROMPT}
+        
+"""
+_CLAIM_SECTION_TEMPLATE = """        EMAIL CONTEXT:
+        - Subject: {email_subject}
+        - Sender: {sender_email}
+        - Date: {email_date}
+        - Attachments: {attachment_count}
+        
+        CLAIM DOCUMENT CONTENT:
+        {claim_content}
+"""
+_ANALYSIS_PROMPT_TAIL = """        
+        Please analyze this marine insurance claim thoroughly and provide a structured JSON response.
+        """
+
+# Common claim number patterns, tried in order
+_CLAIM_NUMBER_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'Claim[:\s]*([A-Z0-9-]+)',
+    r'Claim\s*Number[:\s]*([A-Z0-9-]+)',
+    r'CLM[:\s]*([A-Z0-9-]+)',
+    r'#([A-Z]{2,3}\d{5,})'
+)]
+
 class ClaimsAnalyzer:
     def __init__(self):
         self.gemini_client = GeminiClient()
@@ -21,13 +53,7 @@ class ClaimsAnalyzer:
             logger.info("Starting claim analysis with Gemini AI")
             
             # Prepare context for analysis
-            context = {
-                'email_subject': email_data.get('subject', ''),
-                'sender_email': email_data.get('sender_email', ''),
-                'email_date': email_data.get('date', ''),
-                'attachment_count': len(email_data.get('attachments', [])),
-                'claim_content': claim_text[:10000]  # Limit context size
-            }
+            context = self._build_context(claim_text, email_data)
             
             # Generate analysis prompt
             prompt = self._build_analysis_prompt(context)
@@ -45,47 +71,110 @@ class ClaimsAnalyzer:
             logger.error(f"Error analyzing claim: {str(e)}")
             return self._get_default_analysis()
     
-    def _build_analysis_prompt(self, context: Dict[str, Any]) -> str:
-        """Build comprehensive analysis prompt"""
-        return f"""
-        {CLAIM_ANALYSIS_PROMPT}
-        
-        EMAIL CONTEXT:
-        - Subject: {context['email_subject']}
-        - Sender: {context['sender_email']}
-        - Date: {context['email_date']}
-        - Attachments: {context['attachment_count']}
+    def analyze_claims_batch(self, claims: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Analyze (claim_text, email_data) pairs with one Gemini call per chunk, results in input order"""
+        contexts = [self._build_context(claim_text, email_data) for claim_text, email_data in claims]
+        results = []
+        for start, end in self._batch_bounds(contexts):
+            chunk = contexts[start:end]
+            if len(chunk) == 1:
+                results.append(self.analyze_claim(*claims[start]))
+                continue
+            try:
+                logger.info(f"Starting batched claim analysis of {len(chunk)} claims with Gemini AI")
+                analysis_result = self.gemini_client.analyze_content(self._build_batch_prompt(chunk))
+                parsed = self._parse_batch_result(analysis_result, chunk)
+            except Exception as e:
+                logger.error(f"Error in batched claim analysis: {str(e)}")
+                parsed = None
+            
+            if parsed is None:
+                # Fall back to one request per claim rather than guess which answer belongs to which claim
+                logger.warning(f"Batched analysis unusable, analyzing {len(chunk)} claims individually")
+                parsed = [self.analyze_claim(*claim) for claim in claims[start:end]]
+            results.extend(parsed)
+        return results
+    
+    def _build_context(self, claim_text: str, email_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Collect the email and document fields the analysis prompt needs"""
+        return {
+            'email_subject': email_data.get('subject', ''),
+            'sender_email': email_data.get('sender_email', ''),
+            'email_date': email_data.get('date', ''),
+            'attachment_count': len(email_data.get('attachments', [])),
+            'claim_content': claim_text[:10000]  # Limit context size
+        }
+    
+    def _batch_bounds(self, contexts: List[Dict[str, Any]]):
+        """Yield (start, end) index ranges that fit CLAIM_ANALYSIS_BATCH_SIZE and MAX_BATCH_TOKENS"""
+        budget = MAX_BATCH_TOKENS * CHARS_PER_TOKEN
+        start, used = 0, 0
+        for i, context in enumerate(contexts):
+            size = len(context['claim_content']) + 500  # Email context and separators
+            if i > start and (i - start >= settings.CLAIM_ANALYSIS_BATCH_SIZE or used + size > budget):
+                yield start, i
+                start, used = i, 0
+            used += size
+        if start < len(contexts):
+            yield start, len(contexts)
+    
+    def _build_batch_prompt(self, contexts: List[Dict[str, Any]]) -> str:
+        """Build one prompt covering several numbered claims"""
+        count = len(contexts)
+        parts = [_ANALYSIS_PROMPT_HEAD, f"        The following {count} marine insurance claims are numbered 1 to {count}.\n"]
+        for number, context in enumerate(contexts, 1):
+            parts.append(f"        \n        CLAIM {number}\n")
+            parts.append(_CLAIM_SECTION_TEMPLATE.format_map(context))
+        parts.append(f"""        
+        Analyze each claim separately and respond with a JSON array of exactly {count} objects,
+        one per claim in the order given, each using the JSON structure described above.
+        """)
+        return ''.join(parts)
+    
+    def _parse_batch_result(self, analysis_text: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Parse a batched response into one analysis per claim, or None if it does not line up"""
+        try:
+            analyses = orjson.loads(self._extract_json(analysis_text))
+        except orjson.JSONDecodeError:
+            return None
         
-        CLAIM DOCUMENT CONTENT:
-        {context['claim_content']}
+        if (not isinstance(analyses, list) or len(analyses) != len(contexts)
+                or not all(isinstance(analysis, dict) for analysis in analyses)):
+            return None
         
-        Please analyze this marine insurance claim thoroughly and provide a structured JSON response.
-        """
+        for analysis_data, context in zip(analyses, contexts):
+            self._add_metadata(analysis_data, context)
+        return analyses
+    
+    def _build_analysis_prompt(self, context: Dict[str, Any]) -> str:
+        """Build comprehensive analysis prompt"""
+        return _ANALYSIS_PROMPT_HEAD + _CLAIM_SECTION_TEMPLATE.format_map(context) + _ANALYSIS_PROMPT_TAIL
     
     def _parse_analysis_result(self, analysis_text: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """Parse AI analysis result into structured data"""
         try:
-            # Try to extract JSON from the response
-            if '```json' in analysis_text:
-                json_str = analysis_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in analysis_text:
-                json_str = analysis_text.split('```')[1].strip()
-            else:
-                json_str = analysis_text
-            
-            analysis_data = json.loads(json_str)
-            
-            # Add metadata
-            analysis_data['analysis_timestamp'] = context.get('email_date', '')
-            analysis_data['source_email'] = context['sender_email']
-            analysis_data['content_length'] = len(context['claim_content'])
-            
+            analysis_data = json.loads(self._extract_json(analysis_text))
+            self._add_metadata(analysis_data, context)
             return analysis_data
             
         except json.JSONDecodeError:
             logger.warning("Could not parse JSON from AI response, using text analysis")
             return self._structure_text_analysis(analysis_text, context)
     
+    def _extract_json(self, analysis_text: str) -> str:
+        """Return the JSON part of a response, unwrapping markdown code fences"""
+        if '```json' in analysis_text:
+            return analysis_text.split('```json')[1].split('```')[0].strip()
+        elif '```' in analysis_text:
+            return analysis_text.split('```')[1].strip()
+        return analysis_text
+    
+    def _add_metadata(self, analysis_data: Dict[str, Any], context: Dict[str, Any]):
+        """Attach source details to a parsed analysis"""
+        analysis_data['analysis_timestamp'] = context.get('email_date', '')
+        analysis_data['source_email'] = context['sender_email']
+        analysis_data['content_length'] = len(context['claim_content'])
+    
     def _structure_text_analysis(self, analysis_text: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """Structure text analysis when JSON parsing fails"""
         return {
@@ -107,17 +196,8 @@ class ClaimsAnalyzer:
     
     def _extract_claim_number(self, text: str) -> str:
         """Extract claim number from text"""
-        import re
-        # Common claim number patterns
-        patterns = [
-            r'Claim[:\s]*([A-Z0-9-]+)',
-            r'Claim\s*Number[:\s]*([A-Z0-9-]+)',
-            r'CLM[:\s]*([A-Z0-9-]+)',
-            r'#([A-Z]{2,3}\d{5,})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _CLAIM_NUMBER_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group(1)
         
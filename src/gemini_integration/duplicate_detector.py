@@ -3,6 +3,12 @@ import logging
 from typing import Dict, Any, List, Optional
 from difflib import SequenceMatcher
 import hashlib
+import heapq
+import orjson
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
 
 from config.settings import settings
 from .gemini_client import GeminiClient
@@ -11,9 +17,50 @@ from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Stored claims shown to the AI check: the most similar few, reduced to their discriminating fields
+AI_CANDIDATE_LIMIT = 5
+_PROMPT_FIELDS = ('claim_number', 'insured_party', 'loss_date', 'claim_amount')
+_PROMPT_DESCRIPTION_CHARS = 200
+
 class DuplicateDetector:
     def __init__(self):
         self.gemini_client = GeminiClient()
+        # Exact-match index over the processed claims registry: fingerprint -> claim ids, and back
+        self._fp_index: Dict[str, List[str]] = {}
+        self._fp_by_id: Dict[str, str] = {}
+        # Lower-cased comparison text per claim id, so fuzzy matching never rebuilds it
+        self._claim_texts: Dict[str, str] = {}
+    
+    def add_claim(self, claim_id: str, claim: Dict[str, Any]):
+        """Index a claim stored in the registry so exact-match checks stay O(1)"""
+        fingerprint = self._create_claim_fingerprint(claim)
+        previous = self._fp_by_id.get(claim_id)
+        if previous == fingerprint:
+            return
+        if previous is not None:
+            self._remove_claim(claim_id)
+        self._fp_by_id[claim_id] = fingerprint
+        self._fp_index.setdefault(fingerprint, []).append(claim_id)
+        self._claim_texts[claim_id] = self._get_claim_text(claim).lower()
+    
+    def _remove_claim(self, claim_id: str):
+        """Drop a claim from the fingerprint index"""
+        fingerprint = self._fp_by_id.pop(claim_id, None)
+        self._claim_texts.pop(claim_id, None)
+        claim_ids = self._fp_index.get(fingerprint)
+        if claim_ids:
+            claim_ids.remove(claim_id)
+            if not claim_ids:
+                del self._fp_index[fingerprint]
+    
+    def _sync_index(self, processed_claims: Dict[str, Any]):
+        """Catch the index up with claims added to or removed from the registry without add_claim"""
+        if len(self._fp_by_id) == len(processed_claims):
+            return
+        for claim_id in self._fp_by_id.keys() - processed_claims.keys():
+            self._remove_claim(claim_id)
+        for claim_id in processed_claims.keys() - self._fp_by_id.keys():
+            self.add_claim(claim_id, processed_claims[claim_id])
     
     def check_duplicate(self, current_claim: Dict[str, Any], processed_claims: Dict[str, Any]) -> Dict[str, Any]:
         """Check if current claim is a duplicate of previously processed claims"""
@@ -23,8 +70,13 @@ class DuplicateDetector:
             if not processed_claims:
                 return {'is_duplicate': False, 'confidence': 0.0}
             
-            # Multiple detection methods
+            # Multiple detection methods; an exact fingerprint hit is conclusive, so skip the costlier ones
             exact_matches = self._check_exact_matches(current_claim, processed_claims)
+            if exact_matches:
+                duplicate_result = self._combine_duplicate_results(exact_matches, [], [])
+                logger.info("Duplicate check completed: exact fingerprint match")
+                return duplicate_result
+            
             similar_matches = self._check_similar_matches(current_claim, processed_claims)
             ai_matches = self._ai_duplicate_check(current_claim, processed_claims)
             
@@ -42,51 +94,57 @@ class DuplicateDetector:
     
     def _check_exact_matches(self, current_claim: Dict[str, Any], processed_claims: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Check for exact matches using claim fingerprints"""
-        matches = []
+        self._sync_index(processed_claims)
         current_fingerprint = self._create_claim_fingerprint(current_claim)
         
-        for claim_id, existing_claim in processed_claims.items():
-            existing_fingerprint = self._create_claim_fingerprint(existing_claim)
-            
-            if current_fingerprint == existing_fingerprint:
-                matches.append({
-                    'claim_id': claim_id,
-                    'match_type': 'exact',
-                    'confidence': 1.0,
-                    'matching_fields': ['full_claim_fingerprint']
-                })
-        
-        return matches
+        return [
+            {
+                'claim_id': claim_id,
+                'match_type': 'exact',
+                'confidence': 1.0,
+                'matching_fields': ['full_claim_fingerprint']
+            }
+            for claim_id in self._fp_index.get(current_fingerprint, ())
+        ]
     
     def _check_similar_matches(self, current_claim: Dict[str, Any], processed_claims: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Check for similar matches using fuzzy matching"""
-        matches = []
-        current_text = self._get_claim_text(current_claim)
+        self._sync_index(processed_claims)
+        current_text = self._get_claim_text(current_claim).lower()
         
-        for claim_id, existing_claim in processed_claims.items():
-            existing_text = self._get_claim_text(existing_claim)
-            
-            similarity = self._calculate_similarity(current_text, existing_text)
-            
-            if similarity > settings.DUPLICATE_THRESHOLD:
-                matches.append({
-                    'claim_id': claim_id,
-                    'match_type': 'similar',
-                    'confidence': similarity,
-                    'matching_fields': ['claim_content']
-                })
+        if process is not None:
+            # One C-level pass over every stored claim; scores below the threshold are pruned inside rapidfuzz
+            hits = process.extract(
+                current_text, self._claim_texts, scorer=fuzz.ratio,
+                score_cutoff=settings.DUPLICATE_THRESHOLD * 100, limit=None
+            )
+            scored = ((claim_id, score / 100) for _, score, claim_id in hits)
+        else:
+            scored = ((claim_id, self._calculate_similarity(current_text, existing_text, settings.DUPLICATE_THRESHOLD))
+                      for claim_id, existing_text in self._claim_texts.items())
         
-        return matches
+        return [
+            {
+                'claim_id': claim_id,
+                'match_type': 'similar',
+                'confidence': similarity,
+                'matching_fields': ['claim_content']
+            }
+            for claim_id, similarity in scored
+            if similarity > settings.DUPLICATE_THRESHOLD
+        ]
     
     def _ai_duplicate_check(self, current_claim: Dict[str, Any], processed_claims: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Use AI to detect sophisticated duplicates"""
         try:
-            if len(processed_claims) > 10:  # Limit for performance
-                sample_claims = dict(list(processed_claims.items())[:10])
-            else:
-                sample_claims = processed_claims
+            # Only the closest stored claims are worth the model's attention (and the prompt tokens)
+            candidate_ids = self._nearest_claims(current_claim, processed_claims, AI_CANDIDATE_LIMIT)
+            if not candidate_ids:
+                return []
+            candidates = {claim_id: self._project_for_prompt(processed_claims[claim_id], claim_id)
+                          for claim_id in candidate_ids}
             
-            prompt = self._build_duplicate_prompt(current_claim, sample_claims)
+            prompt = self._build_duplicate_prompt(self._project_for_prompt(current_claim), candidates)
             ai_result = self.gemini_client.analyze_content(prompt)
             
             return self._parse_ai_duplicate_result(ai_result, processed_claims)
@@ -95,16 +153,40 @@ class DuplicateDetector:
             logger.error(f"AI duplicate check failed: {str(e)}")
             return []
     
+    def _nearest_claims(self, current_claim: Dict[str, Any], processed_claims: Dict[str, Any], limit: int) -> List[str]:
+        """Ids of the stored claims most similar to current_claim, best first"""
+        self._sync_index(processed_claims)
+        current_text = self._get_claim_text(current_claim).lower()
+        if process is not None:
+            return [claim_id for _, _, claim_id in
+                    process.extract(current_text, self._claim_texts, scorer=fuzz.ratio, limit=limit)]
+        scored = heapq.nlargest(
+            limit, self._claim_texts.items(),
+            key=lambda item: self._calculate_similarity(current_text, item[1])
+        )
+        return [claim_id for claim_id, _ in scored]
+    
+    def _project_for_prompt(self, claim: Dict[str, Any], claim_id: str = None) -> Dict[str, Any]:
+        """Reduce a claim to the fields that tell duplicates apart, with a shortened description"""
+        projected = {field: claim[field] for field in _PROMPT_FIELDS if claim.get(field)}
+        if claim_id is not None:
+            # Registry entries are keyed by claim number
+            projected.setdefault('claim_number', claim_id)
+        description = claim.get('loss_description')
+        if description:
+            projected['loss_description'] = str(description)[:_PROMPT_DESCRIPTION_CHARS]
+        return projected
+    
     def _build_duplicate_prompt(self, current_claim: Dict[str, Any], processed_claims: Dict[str, Any]) -> str:
         """Build prompt for AI duplicate detection"""
         return f"""
         {DUPLICATE_DETECTION_PROMPT}
         
         CURRENT CLAIM:
-        {json.dumps(current_claim, indent=2)}
+        {orjson.dumps(current_claim).decode()}
         
         PREVIOUSLY PROCESSED CLAIMS:
-        {json.dumps(processed_claims, indent=2)}
+        {orjson.dumps(processed_claims).decode()}
         
         Analyze if the current claim is a duplicate or variation of any previously processed claims.
         Consider similarities in: claim details, amounts, dates, parties involved, and loss descriptions.
@@ -139,16 +221,18 @@ class DuplicateDetector:
     
     def _create_claim_fingerprint(self, claim: Dict[str, Any]) -> str:
         """Create a fingerprint for exact matching"""
-        key_fields = [
+        # Only held in the in-memory index, so the digest can change freely; blake2b beats MD5 on short inputs
+        hasher = hashlib.blake2b(digest_size=16)
+        for field in (
             claim.get('claim_number', ''),
             claim.get('insured_party', ''),
-            str(claim.get('claim_amount', 0)),
+            claim.get('claim_amount', 0),
             claim.get('loss_date', ''),
             claim.get('loss_location', '')
-        ]
-        
-        fingerprint_text = '|'.join(key_fields)
-        return hashlib.md5(fingerprint_text.encode()).hexdigest()
+        ):
+            hasher.update(str(field).encode())
+            hasher.update(b'\0')
+        return hasher.hexdigest()
     
     def _get_claim_text(self, claim: Dict[str, Any]) -> str:
         """Extract text for similarity comparison"""
@@ -162,9 +246,16 @@ class DuplicateDetector:
         
         return ' '.join(str(part) for part in text_parts if part)
     
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """Calculate text similarity using SequenceMatcher"""
-        return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
+    def _calculate_similarity(self, text1: str, text2: str, floor: float = 0.0) -> float:
+        """Calculate similarity of two lower-cased texts using SequenceMatcher
+        
+        Returns 0.0 without the full comparison when the cheap upper bounds already rule out beating floor.
+        """
+        # autojunk would ignore frequent characters in texts over 200 chars and understate their similarity
+        matcher = SequenceMatcher(None, text1, text2, autojunk=False)
+        if matcher.real_quick_ratio() <= floor or matcher.quick_ratio() <= floor:
+            return 0.0
+        return matcher.ratio()
     
     def _combine_duplicate_results(self, exact_matches: List, similar_matches: List, ai_matches: List) -> Dict[str, Any]:
         """Combine results from different detection methods"""
@@ -1,86 +1,189 @@
-import json
+import hashlib
 import logging
-from typing import Dict, Any, List
+from datetime import date, datetime
+from itertools import islice
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, List, Tuple, ClassVar, Mapping, FrozenSet, Optional
 import re
+import numpy as np
+import orjson
+import pandas as pd
+try:
+    import re2
+except ImportError:
+    re2 = None
 
 from config.settings import settings
 from .gemini_client import GeminiClient
 from .prompts import FRAUD_DETECTION_PROMPT
+from utils.cache import TTLCache
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Rule-based checks compiled once; case-insensitive, so they search the raw fields without lowering a copy first
+_VAGUE_LOCATION_RE = re.compile('unknown|tbd|n/a', re.IGNORECASE)
+_URGENCY_RE = re.compile('urgent|immediate|asap|emergency', re.IGNORECASE)
+# Auto-generated (long numeric) local parts or throwaway domains, in one pass over the sender address
+_SUSPICIOUS_EMAIL_PATTERN = r'(?i)\d{6,}@|temp-mail|throwaway|guerrillamail'
+_SUSPICIOUS_EMAIL_RE = re.compile(_SUSPICIOUS_EMAIL_PATTERN)
+# Sender addresses are attacker-controlled; RE2 matches in linear time where \d{6,}@ would backtrack
+_suspicious_email_search = re2.compile(_SUSPICIOUS_EMAIL_PATTERN).search if re2 is not None else _SUSPICIOUS_EMAIL_RE.search
+
+# Body of a ```json fenced block; the body can never run across a ``` so matching stays linear
+_FENCED_JSON_RE = re.compile(r'```json(?P<body>(?:[^`]|`(?!``))*)```')
+
+@lru_cache(maxsize=8192)
+def _parse_loss_date(date_str: str) -> Optional[date]:
+    """Parse a YYYY-MM-DD loss date (None if it is not one); repeated dates are answered from the cache"""
+    try:
+        if len(date_str) == 10 and date_str[5:7].isdigit():
+            # C-level fast path for the zero-padded form (not ISO week dates); strptime also accepts e.g. 2024-1-5
+            return date.fromisoformat(date_str)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+# Rule weights in bit order: amount, date, location, sender, urgency
+_RULE_WEIGHTS = (0.3, 0.2, 0.1, 0.2, 0.1)
+
+def _rule_score(mask: int) -> float:
+    # Summed in rule order, so the floats match adding the weights one rule at a time
+    score = 0.0
+    for bit, weight in enumerate(_RULE_WEIGHTS):
+        if mask >> bit & 1:
+            score += weight
+    return min(score, 1.0)
+
+# Score of every combination of triggered rules, indexed by the 5-bit trigger mask
+_RULE_SCORE_TABLE = tuple(_rule_score(mask) for mask in range(1 << len(_RULE_WEIGHTS)))
+_RULE_BITS = np.array([1 << bit for bit in range(len(_RULE_WEIGHTS))])
+
 class FraudDetector:
+    __slots__ = ('gemini_client', '_analysis_cache')
+    
+    # Known fraud patterns, shared read-only by every instance
+    FRAUD_PATTERNS: ClassVar[Mapping[str, FrozenSet[str]]] = MappingProxyType({
+        'amount_patterns': frozenset({'round numbers', 'unusually high', 'inconsistent with history'}),
+        'date_patterns': frozenset({'weekend losses', 'holiday losses', 'recent dates'}),
+        'location_patterns': frozenset({'high-risk areas', 'vague locations', 'multiple locations'}),
+        'document_patterns': frozenset({'inconsistent dates', 'poor quality', 'missing information'})
+    })
+    
     def __init__(self):
         self.gemini_client = GeminiClient()
-        self.fraud_patterns = self._load_fraud_patterns()
+        # Parsed AI assessments by prompt digest, skipping both the API call and the parse on repeats
+        self._analysis_cache = TTLCache(maxsize=settings.GEMINI_CACHE_SIZE, ttl=settings.GEMINI_CACHE_TTL_SECONDS)
     
-    def detect_fraud(self, claim_analysis: Dict[str, Any], email_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Detect potential fraud in claim using Gemini AI"""
+    def detect_fraud(self, claim_analysis: Dict[str, Any], email_data: Dict[str, Any],
+                     rule_based_score: float = None) -> Dict[str, Any]:
+        """Detect potential fraud in claim using Gemini AI
+        
+        rule_based_score can be passed in when it was already computed by batch_rule_based_scores.
+        """
         try:
             logger.info("Starting fraud detection analysis")
             
             # Combine rule-based and AI-based detection
-            rule_based_score = self._rule_based_fraud_detection(claim_analysis, email_data)
+            if rule_based_score is None:
+                rule_based_score = self._rule_based_fraud_detection(claim_analysis, email_data)
             ai_based_analysis = self._ai_based_fraud_detection(claim_analysis, email_data)
             
-            # Combine scores
-            final_score = self._combine_fraud_scores(rule_based_score, ai_based_analysis)
-            
-            fraud_result = {
-                'fraud_score': final_score,
-                'risk_level': self._get_risk_level(final_score),
-                'rule_based_score': rule_based_score,
-                'ai_analysis': ai_based_analysis,
-                'red_flags': self._extract_red_flags(claim_analysis, ai_based_analysis),
-                'recommendations': self._generate_fraud_recommendations(final_score, ai_based_analysis),
-                'detection_methods': ['rule_based', 'ai_analysis']
-            }
+            fraud_result = self._build_fraud_result(claim_analysis, rule_based_score, ai_based_analysis)
             
-            logger.info(f"Fraud detection completed - Score: {final_score:.2f}")
+            logger.info("Fraud detection completed - Score: %.2f", fraud_result['fraud_score'])
             return fraud_result
             
         except Exception as e:
-            logger.error(f"Error in fraud detection: {str(e)}")
+            logger.error("Error in fraud detection: %s", e)
             return self._get_default_fraud_analysis()
     
+    def detect_fraud_batch(self, claims: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """detect_fraud for many (claim_analysis, email_data) pairs, with one Gemini call per chunk of claims"""
+        try:
+            rule_scores = self.batch_rule_based_scores(claims)
+        except Exception as e:
+            logger.error("Batch rule-based fraud scoring failed: %s", e)
+            rule_scores = [None] * len(claims)
+        
+        results = []
+        for start in range(0, len(claims), settings.FRAUD_ANALYSIS_BATCH_SIZE):
+            chunk = claims[start:start + settings.FRAUD_ANALYSIS_BATCH_SIZE]
+            ai_analyses = self._ai_based_fraud_detection_batch(chunk) if len(chunk) > 1 else None
+            if ai_analyses is None:
+                # Single claim, or a batch answer that does not line up: the per-claim path
+                results.extend(self.detect_fraud(claim_analysis, email_data, rule_score)
+                               for (claim_analysis, email_data), rule_score
+                               in zip(chunk, rule_scores[start:start + len(chunk)]))
+                continue
+            for (claim_analysis, email_data), rule_score, ai_analysis in zip(chunk, rule_scores[start:], ai_analyses):
+                try:
+                    if rule_score is None:
+                        rule_score = self._rule_based_fraud_detection(claim_analysis, email_data)
+                    results.append(self._build_fraud_result(claim_analysis, rule_score, ai_analysis))
+                except Exception as e:
+                    logger.error("Error in fraud detection: %s", e)
+                    results.append(self._get_default_fraud_analysis())
+        return results
+    
+    def _build_fraud_result(self, claim_analysis: Dict[str, Any], rule_based_score: float,
+                            ai_based_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the rule-based score and AI assessment into the fraud result"""
+        final_score = self._combine_fraud_scores(rule_based_score, ai_based_analysis)
+        return {
+            'fraud_score': final_score,
+            'risk_level': self._get_risk_level(final_score),
+            'rule_based_score': rule_based_score,
+            'ai_analysis': ai_based_analysis,
+            'red_flags': self._extract_red_flags(claim_analysis, ai_based_analysis),
+            'recommendations': self._generate_fraud_recommendations(final_score, ai_based_analysis),
+            'detection_methods': ['rule_based', 'ai_analysis']
+        }
+    
     def _rule_based_fraud_detection(self, claim_analysis: Dict[str, Any], email_data: Dict[str, Any]) -> float:
         """Rule-based fraud detection using predefined patterns"""
-        score = 0.0
-        triggers = []
-        
-        # Check claim amount anomalies
-        claim_amount = claim_analysis.get('claim_amount', 0)
-        if claim_amount > 1000000:  # Over $1M
-            score += 0.3
-            triggers.append("High claim amount")
-        
-        # Check date inconsistencies
-        loss_date = claim_analysis.get('loss_date', '')
-        if self._suspicious_date_pattern(loss_date):
-            score += 0.2
-            triggers.append("Suspicious date pattern")
-        
-        # Check location patterns
-        location = claim_analysis.get('loss_location', '').lower()
-        if any(pattern in location for pattern in ['unknown', 'tbd', 'n/a']):
-            score += 0.1
-            triggers.append("Vague location")
-        
-        # Check sender email patterns
-        sender_email = email_data.get('sender_email', '').lower()
-        if self._suspicious_email_pattern(sender_email):
-            score += 0.2
-            triggers.append("Suspicious sender email")
+        mask = (
+            (claim_analysis.get('claim_amount', 0) > 1000000)  # Over $1M
+            | self._suspicious_date_pattern(claim_analysis.get('loss_date', '')) << 1
+            | bool(_VAGUE_LOCATION_RE.search(claim_analysis.get('loss_location', ''))) << 2
+            | self._suspicious_email_pattern(email_data.get('sender_email', '')) << 3
+            | bool(_URGENCY_RE.search(email_data.get('subject', ''))) << 4
+        )
+        return _RULE_SCORE_TABLE[mask]
+    
+    def batch_rule_based_scores(self, claims: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[float]:
+        """Rule-based scores for many (claim_analysis, email_data) pairs, computed column-wise in one pass"""
+        if not claims:
+            return []
+        frame = pd.DataFrame({
+            'claim_amount': [claim.get('claim_amount', 0) for claim, _ in claims],
+            'loss_date': [claim.get('loss_date', '') for claim, _ in claims],
+            'loss_location': [claim.get('loss_location', '') for claim, _ in claims],
+            'sender_email': [email_data.get('sender_email', '') for _, email_data in claims],
+            'subject': [email_data.get('subject', '') for _, email_data in claims]
+        })
         
-        # Check for urgency language in subject
-        subject = email_data.get('subject', '').lower()
-        urgency_words = ['urgent', 'immediate', 'asap', 'emergency']
-        if any(word in subject for word in urgency_words):
-            score += 0.1
-            triggers.append("Urgency language")
+        # Same signals as _rule_based_fraud_detection; a non-numeric amount simply does not trigger
+        amount = pd.to_numeric(frame['claim_amount'], errors='coerce')
+        dates = frame['loss_date'].fillna('').astype(str)
+        parsed_dates = pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce')
+        recent = (pd.Timestamp.now() - parsed_dates).dt.days < 7
+        location = frame['loss_location'].fillna('').astype(str)
+        sender = frame['sender_email'].fillna('').astype(str)
+        subject = frame['subject'].fillna('').astype(str)
         
-        return min(score, 1.0)
+        flags = np.column_stack([
+            (amount > 1000000).to_numpy(),
+            (dates.str.lower().isin(['unknown', 'n/a', '']) | recent).to_numpy(),
+            location.str.contains(_VAGUE_LOCATION_RE).to_numpy(),
+            sender.str.contains(_SUSPICIOUS_EMAIL_RE).to_numpy(),
+            subject.str.contains(_URGENCY_RE).to_numpy()
+        ])
+        return [_RULE_SCORE_TABLE[mask] for mask in (flags @ _RULE_BITS).tolist()]
     
     def _ai_based_fraud_detection(self, claim_analysis: Dict[str, Any], email_data: Dict[str, Any]) -> Dict[str, Any]:
         """AI-based fraud detection using Gemini"""
@@ -89,7 +192,7 @@ class FraudDetector:
             {FRAUD_DETECTION_PROMPT}
             
             CLAIM ANALYSIS DATA:
-            {json.dumps(claim_analysis, indent=2)}
+            {orjson.dumps(claim_analysis, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()}
             
             EMAIL CONTEXT:
             - Subject: {email_data.get('subject', '')}
@@ -99,27 +202,86 @@ class FraudDetector:
             Analyze this marine insurance claim for potential fraud indicators and provide a detailed assessment.
             """
             
-            analysis_result = self.gemini_client.analyze_content(prompt)
-            return self._parse_fraud_analysis(analysis_result)
+            cache_key = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest()
+            cached = self._analysis_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached)
+            
+            # Streamed so generation stops as soon as the fenced JSON block is closed
+            analysis_result = self.gemini_client.analyze_content_stream(prompt, stop_when=_FENCED_JSON_RE.search)
+            parsed = self._parse_fraud_analysis(analysis_result)
+            # Failed calls come back as text, so only keep assessments the model actually produced
+            if not analysis_result.startswith('Analysis failed'):
+                self._analysis_cache.set(cache_key, parsed)
+            return dict(parsed)
             
         except Exception as e:
-            logger.error(f"AI fraud detection failed: {str(e)}")
+            logger.error("AI fraud detection failed: %s", e)
             return {'error': str(e), 'score': 0.5}
     
+    def _ai_based_fraud_detection_batch(self, claims: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+        """AI fraud assessments for several claims from one Gemini call, or None if the answer is unusable"""
+        try:
+            payload = {'claims': [
+                {
+                    'claim_analysis': claim_analysis,
+                    'email_context': {
+                        'subject': email_data.get('subject', ''),
+                        'sender': email_data.get('sender_email', ''),
+                        'date': email_data.get('date', '')
+                    }
+                }
+                for claim_analysis, email_data in claims
+            ]}
+            prompt = f"""
+            {FRAUD_DETECTION_PROMPT}
+            
+            CLAIMS ({len(claims)}):
+            {orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode()}
+            
+            Analyze each of these marine insurance claims separately for potential fraud indicators.
+            Respond with a JSON object {{"results": [...]}} holding exactly {len(claims)} objects,
+            one per claim in the order given, each using the JSON structure described above.
+            """
+            
+            logger.info("Starting batched fraud analysis of %d claims", len(claims))
+            analysis_result = self.gemini_client.analyze_content_stream(prompt, stop_when=_FENCED_JSON_RE.search)
+            json_str = self._extract_json(analysis_result)
+            results = orjson.loads(json_str).get('results') if json_str else None
+            if (not isinstance(results, list) or len(results) != len(claims)
+                    or not all(isinstance(result, dict) for result in results)):
+                logger.warning("Batched fraud analysis unusable, analyzing %d claims individually", len(claims))
+                return None
+            return results
+            
+        except Exception as e:
+            logger.error("Batched AI fraud detection failed: %s", e)
+            return None
+    
+    def _extract_json(self, analysis_text: str) -> Optional[str]:
+        """JSON text of an AI response: a fenced json block, else the outermost braces"""
+        match = _FENCED_JSON_RE.search(analysis_text)
+        if match:
+            return match['body'].strip()
+        # Unfenced answer: take the outermost braces, found with two plain scans
+        start, end = analysis_text.find('{'), analysis_text.rfind('}')
+        if start != -1 and end > start:
+            return analysis_text[start:end + 1]
+        return None
+    
     def _parse_fraud_analysis(self, analysis_text: str) -> Dict[str, Any]:
         """Parse AI fraud analysis result"""
+        json_str = self._extract_json(analysis_text)
+        if json_str is None:
+            return {
+                'fraud_indicators': ['Analysis completed but parsing failed'],
+                'confidence': 0.5,
+                'recommendations': ['Manual review recommended'],
+                'raw_analysis': analysis_text
+            }
         try:
-            if '```json' in analysis_text:
-                json_str = analysis_text.split('```json')[1].split('```')[0].strip()
-                return json.loads(json_str)
-            else:
-                return {
-                    'fraud_indicators': ['Analysis completed but parsing failed'],
-                    'confidence': 0.5,
-                    'recommendations': ['Manual review recommended'],
-                    'raw_analysis': analysis_text
-                }
-        except:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
             return {
                 'fraud_indicators': ['Analysis parsing error'],
                 'confidence': 0.5,
@@ -133,28 +295,17 @@ class FraudDetector:
             return True
         
         # Check for recent dates only (potential for backdating)
-        from datetime import datetime
-        try:
-            loss_date = datetime.strptime(date_str, '%Y-%m-%d')
-            days_diff = (datetime.now() - loss_date).days
+        loss_date = _parse_loss_date(date_str)
+        if loss_date is not None:
+            days_diff = (date.today() - loss_date).days
             if days_diff < 7:  # Very recent loss
                 return True
-        except:
-            pass
         
         return False
     
     def _suspicious_email_pattern(self, email: str) -> bool:
         """Check for suspicious email patterns"""
-        suspicious_domains = ['temp-mail', 'throwaway', 'guerrillamail']
-        if any(domain in email for domain in suspicious_domains):
-            return True
-        
-        # Check for numeric patterns (like auto-generated emails)
-        if re.search(r'\d{6,}@', email):
-            return True
-        
-        return False
+        return _suspicious_email_search(email) is not None
     
     def _combine_fraud_scores(self, rule_score: float, ai_analysis: Dict[str, Any]) -> float:
         """Combine rule-based and AI-based fraud scores"""
@@ -184,12 +335,12 @@ class FraudDetector:
         if claim_analysis.get('claim_amount', 0) > 1000000:
             red_flags.append("Exceptionally high claim amount")
         
-        # From AI analysis
+        # From AI analysis, taking only as many as fit in the top 10
         if isinstance(ai_analysis, dict):
             indicators = ai_analysis.get('fraud_indicators', [])
-            red_flags.extend(indicators)
+            red_flags.extend(islice(indicators, 10 - len(red_flags)))
         
-        return red_flags[:10]  # Limit to top 10
+        return red_flags
     
     def _generate_fraud_recommendations(self, score: float, ai_analysis: Dict[str, Any]) -> List[str]:
         """Generate fraud prevention recommendations"""
@@ -216,16 +367,7 @@ class FraudDetector:
             ai_recommendations = ai_analysis.get('recommendations', [])
             recommendations.extend(ai_recommendations)
         
-        return list(set(recommendations))[:5]  # Remove duplicates and limit
-    
-    def _load_fraud_patterns(self) -> Dict[str, Any]:
-        """Load known fraud patterns"""
-        return {
-            'amount_patterns': ['round numbers', 'unusually high', 'inconsistent with history'],
-            'date_patterns': ['weekend losses', 'holiday losses', 'recent dates'],
-            'location_patterns': ['high-risk areas', 'vague locations', 'multiple locations'],
-            'document_patterns': ['inconsistent dates', 'poor quality', 'missing information']
-        }
+        return list(dict.fromkeys(recommendations))[:5]  # Remove duplicates (keeping order) and limit
     
     def _get_default_fraud_analysis(self) -> Dict[str, Any]:
         """Return default fraud analysis when detection fails"""
@@ -1,20 +1,73 @@
 import os
+import asyncio
+import hashlib
 import logging
+import random
+import time
 import google.generativeai as genai
-from typing import Dict, Any, Optional
+from google.api_core.exceptions import ResourceExhausted
+from typing import Callable, Dict, Any, Optional
+try:
+    import redis
+except ImportError:
+    redis = None
 from typing import Dict,Any, Optional, List
 
 from config.settings import settings
+from utils.cache import TTLCache
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Sent once as the model's system instruction rather than prepended to every prompt
+SYSTEM_INSTRUCTION = """
+You are an expert marine insurance claims analyst. Your role is to analyze insurance claims
+for completeness, accuracy, and potential issues. Provide structured, professional analysis
+focusing on key insurance aspects like coverage, liability, damages, and fraud indicators.
+
+Always respond with comprehensive, well-structured analysis that includes:
+1. Clear identification of key claim elements
+2. Assessment of claim validity
+3. Identification of potential issues or red flags
+4. Professional recommendations
+
+Format your response using clear sections and structured data where appropriate.
+"""
+
+# Shared by every client, so the analyzer, fraud and duplicate detectors all benefit
+_response_cache = TTLCache(maxsize=settings.GEMINI_CACHE_SIZE, ttl=settings.GEMINI_CACHE_TTL_SECONDS)
+
+class _TokenBucket:
+    """Async rate limiter handing out `rate` tokens per second, bursting up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def consume(self, tokens: float = 1):
+        """Wait until `tokens` are available and take them"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
 class GeminiClient:
+    __slots__ = ('api_key', 'model_name', 'max_tokens', '_model', '_redis')
+    
     def __init__(self):
         self.api_key = settings.GEMINI_API_KEY
         self.model_name = settings.GEMINI_MODEL
         self.max_tokens = settings.GEMINI_MAX_TOKENS
         self._configure_client()
+        self._redis = self._connect_redis()
     
     def _configure_client(self):
         """Configure Gemini AI client"""
@@ -23,78 +76,180 @@ class GeminiClient:
                 raise ValueError("Gemini API key not configured")
             
             genai.configure(api_key=self.api_key)
+            # Built once and reused; the model object holds no per-request state
+            self._model = genai.GenerativeModel(
+                self.model_name,
+                system_instruction=SYSTEM_INSTRUCTION,
+                generation_config={
+                    'max_output_tokens': self.max_tokens,
+                    'temperature': 0.1  # Low temperature for consistent results
+                }
+            )
             logger.info("Gemini AI client configured successfully")
             
         except Exception as e:
-            logger.error(f"Error configuring Gemini client: {str(e)}")
+            logger.error("Error configuring Gemini client: %s", e)
             raise
     
     def analyze_content(self, prompt: str, context: Optional[Dict[str, Any]] = None) -> str:
         """Analyze content using Gemini AI"""
         try:
-            model = genai.GenerativeModel(self.model_name)
-            
             # Prepare the full prompt
             full_prompt = self._prepare_prompt(prompt, context)
             
+            cache_key = self._cache_key(full_prompt)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                logger.info("Gemini AI analysis served from cache")
+                return cached
+            
             # Generate response
-            response = model.generate_content(
-                full_prompt,
-                generation_config={
-                    'max_output_tokens': self.max_tokens,
-                    'temperature': 0.1  # Low temperature for consistent results
-                }
-            )
+            response = self._model.generate_content(full_prompt)
+            return self._response_text(response, cache_key)
+                
+        except Exception as e:
+            logger.error("Error in Gemini AI analysis: %s", e)
+            return f"Analysis failed: {str(e)}"
+    
+    def analyze_content_stream(self, prompt: str, context: Optional[Dict[str, Any]] = None,
+                               stop_when: Optional[Callable[[str], bool]] = None) -> str:
+        """Analyze content with a streamed response, stopping early once stop_when accepts the text so far"""
+        try:
+            full_prompt = self._prepare_prompt(prompt, context)
+            
+            cache_key = self._cache_key(full_prompt)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                logger.info("Gemini AI analysis served from cache")
+                return cached
             
-            if response.text:
-                logger.info("Gemini AI analysis completed successfully")
-                return response.text
-            else:
+            response = self._model.generate_content(full_prompt, stream=True)
+            parts = []
+            text = ''
+            for chunk in response:
+                try:
+                    parts.append(chunk.text)
+                except ValueError:
+                    # Chunk without text parts (e.g. only a finish reason)
+                    continue
+                text = ''.join(parts)
+                if stop_when is not None and stop_when(text):
+                    # Enough to act on; the remainder of the stream is dropped and not cached
+                    logger.info("Gemini AI analysis stopped early after %d characters", len(text))
+                    return text
+            
+            text = ''.join(parts)
+            if not text:
                 logger.error("Empty response from Gemini AI")
                 return "Analysis failed - empty response"
-                
+            logger.info("Gemini AI analysis completed successfully")
+            self._store_response(cache_key, text)
+            return text
+            
+        except Exception as e:
+            logger.error("Error in Gemini AI analysis: %s", e)
+            return f"Analysis failed: {str(e)}"
+    
+    async def analyze_content_async(self, prompt: str, context: Optional[Dict[str, Any]] = None) -> str:
+        """Analyze content using Gemini AI without blocking the event loop, retrying rate-limited requests"""
+        try:
+            full_prompt = self._prepare_prompt(prompt, context)
+            
+            cache_key = self._cache_key(full_prompt)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                logger.info("Gemini AI analysis served from cache")
+                return cached
+            
+            for attempt in range(settings.GEMINI_MAX_RETRIES + 1):
+                try:
+                    response = await self._model.generate_content_async(full_prompt)
+                    break
+                except ResourceExhausted:
+                    # 429: back off exponentially with jitter so concurrent requests do not retry in lockstep
+                    if attempt == settings.GEMINI_MAX_RETRIES:
+                        raise
+                    delay = min(60, 2 ** attempt) * random.uniform(0.5, 1.5)
+                    logger.warning("Gemini rate limit hit, retrying in %.1fs", delay)
+                    await asyncio.sleep(delay)
+            
+            return self._response_text(response, cache_key)
+            
         except Exception as e:
-            logger.error(f"Error in Gemini AI analysis: {str(e)}")
+            logger.error("Error in Gemini AI analysis: %s", e)
             return f"Analysis failed: {str(e)}"
     
+    def _response_text(self, response, cache_key: str) -> str:
+        """Return the response text (caching it), or a failure message for an empty response"""
+        if response.text:
+            logger.info("Gemini AI analysis completed successfully")
+            self._store_response(cache_key, response.text)
+            return response.text
+        else:
+            logger.error("Empty response from Gemini AI")
+            return "Analysis failed - empty response"
+    
+    def _connect_redis(self):
+        """Redis client for the response cache shared between processes, if REDIS_URL is configured"""
+        if not settings.REDIS_URL:
+            return None
+        if redis is None:
+            logger.warning("REDIS_URL is set but the redis package is not installed; using the in-process cache only")
+            return None
+        # Connects lazily on first use; short timeouts so a slow Redis never costs more than the call it saves
+        return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True,
+                                    socket_timeout=1, socket_connect_timeout=1)
+    
+    def _cached_response(self, cache_key: str) -> Optional[str]:
+        """Look a response up in the in-process cache, then in Redis"""
+        cached = _response_cache.get(cache_key)
+        if cached is None and self._redis is not None:
+            try:
+                cached = self._redis.get(f"gem:{cache_key}")
+            except redis.RedisError as e:
+                logger.warning("Redis response cache unavailable: %s", e)
+            if cached is not None:
+                _response_cache.set(cache_key, cached)
+        return cached
+    
+    def _store_response(self, cache_key: str, text: str):
+        """Remember a response in the in-process cache and in Redis"""
+        _response_cache.set(cache_key, text)
+        if self._redis is not None:
+            try:
+                self._redis.setex(f"gem:{cache_key}", settings.GEMINI_REDIS_TTL_SECONDS, text)
+            except redis.RedisError as e:
+                logger.warning("Redis response cache unavailable: %s", e)
+    
+    def _cache_key(self, full_prompt: str) -> str:
+        """Stable key for a prompt sent to this client's model and settings"""
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(f"{self.model_name}\0{self.max_tokens}\0".encode())
+        hasher.update(full_prompt.encode('utf-8'))
+        return hasher.hexdigest()
+    
     def _prepare_prompt(self, prompt: str, context: Optional[Dict[str, Any]]) -> str:
         """Prepare the complete prompt for Gemini AI"""
-        system_message = """
-        You are an expert marine insurance claims analyst. Your role is to analyze insurance claims
-        for completeness, accuracy, and potential issues. Provide structured, professional analysis
-        focusing on key insurance aspects like coverage, liability, damages, and fraud indicators.
-        
-        Always respond with comprehensive, well-structured analysis that includes:
-        1. Clear identification of key claim elements
-        2. Assessment of claim validity
-        3. Identification of potential issues or red flags
-        4. Professional recommendations
-        
-        Format your response using clear sections and structured data where appropriate.
-        """
-        
         if context:
             context_str = "\n".join([f"{k}: {v}" for k, v in context.items()])
-            return f"{system_message}\n\nCONTEXT:\n{context_str}\n\nPROMPT:\n{prompt}"
+            return f"CONTEXT:\n{context_str}\n\nPROMPT:\n{prompt}"
         else:
-            return f"{system_message}\n\n{prompt}"
+            return prompt
     
     def batch_analyze(self, prompts: List[str]) -> List[str]:
-        """Analyze multiple prompts in sequence (not parallel due to API limits)"""
-        results = []
+        """Analyze multiple prompts concurrently within the configured request rate, results in input order"""
+        return asyncio.run(self.batch_analyze_async(prompts))
+    
+    async def batch_analyze_async(self, prompts: List[str]) -> List[str]:
+        """Analyze prompts with at most GEMINI_MAX_CONCURRENCY requests in flight, paced to GEMINI_REQUESTS_PER_MINUTE"""
+        semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        rate = settings.GEMINI_REQUESTS_PER_MINUTE / 60
+        bucket = _TokenBucket(rate, capacity=settings.GEMINI_MAX_CONCURRENCY)
         
-        for i, prompt in enumerate(prompts):
-            try:
-                logger.info(f"Processing batch item {i+1}/{len(prompts)}")
-                result = self.analyze_content(prompt)
-                results.append(result)
-                
-                # Add delay to respect API rate limits
-                import time
-                time.sleep(2)
-                
-            except Exception as e:
-                logger.error(f"Error in batch analysis item {i+1}: {str(e)}")
-                results.append(f"Analysis failed: {str(e)}")
+        async def bounded(i: int, prompt: str) -> str:
+            async with semaphore:
+                await bucket.consume()
+                logger.info("Processing batch item %d/%d", i + 1, len(prompts))
+                return await self.analyze_content_async(prompt)
         
-        return results
\ No newline at end of file
+        return await asyncio.gather(*(bounded(i, prompt) for i, prompt in enumerate(prompts)))
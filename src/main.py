@@ -3,12 +3,17 @@
 Main entry point for Marine Reinsurance Claims Processing System
 """
 
+import io
 import os
 import sys
 import logging
 import argparse
+import atexit
+import multiprocessing
 import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
 # Add the src directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,9 +22,9 @@ if src_dir not in sys.path:
     sys.path.insert(0, src_dir)
 
 from utils.logger import setup_logger
-from emails.email_processor import EmailProcessor
-from processing.pipeline import ClaimsProcessingPipeline
-from dashboard.app import start_dashboard
+from config.settings import settings
+# EmailProcessor, ClaimsProcessingPipeline and the dashboard are imported in the branches that use them,
+# so --dashboard, --extract-only and --test only pay for the subsystems they run
 
 logger = setup_logger(__name__)
 
@@ -31,11 +36,14 @@ def main():
         epilog="""
 Examples:
   python src/main.py --mode continuous    # Run continuous processing
+  python src/main.py --mode continuous --no-idle --interval 5  # Poll every 5 minutes instead of IMAP IDLE
   python src/main.py --mode batch         # Process all existing emails
   python src/main.py --mode single        # Process only new emails
   python src/main.py --test               # Test system components
   python src/main.py --extract-only       # Only extract emails, no AI analysis
+  python src/main.py --extract-only --max-workers 8  # Extract with 8 concurrent workers
   python src/main.py --dashboard          # Start web dashboard
+  python src/main.py --mode continuous --with-dashboard  # Process continuously and serve the dashboard
         """
     )
     
@@ -43,24 +51,38 @@ Examples:
                        default='continuous', help='Processing mode (default: continuous)')
     parser.add_argument('--interval', type=int, default=1, 
                        help='Check interval in minutes for continuous mode (default: 1)')
+    parser.add_argument('--idle', action=argparse.BooleanOptionalAction, default=True,
+                       help='Continuous mode waits for new mail with IMAP IDLE instead of polling every interval (default: on)')
     parser.add_argument('--test', action='store_true', help='Test system components')
     parser.add_argument('--all', action='store_true', help='Process all emails (batch mode)')
     parser.add_argument('--extract-only', action='store_true', 
                        help='Only extract emails and documents, skip AI analysis')
     parser.add_argument('--max-emails', type=int, default=50,
                        help='Maximum number of emails to process per run (default: 50)')
+    parser.add_argument('--fetch-batch-size', type=int, default=settings.IMAP_FETCH_BATCH_SIZE,
+                       help=f'Emails retrieved per IMAP FETCH during extraction (default: {settings.IMAP_FETCH_BATCH_SIZE})')
+    parser.add_argument('--max-workers', type=int, default=settings.EMAIL_PROCESS_WORKERS,
+                       help=f'Emails processed concurrently during extraction (default: {settings.EMAIL_PROCESS_WORKERS})')
+    parser.add_argument('--with-dashboard', action='store_true',
+                       help='Also serve the web dashboard from a separate process while the chosen mode runs')
     parser.add_argument('--dashboard-host', default='0.0.0.0', help='Dashboard host (default: 0.0.0.0)')
     parser.add_argument('--dashboard-port', type=int, default=5000, help='Dashboard port (default: 5000)')
     
     args = parser.parse_args()
+    settings.ensure_dirs()
     
     try:
         logger.info("🚢 Starting Marine Reinsurance Claims Processing System")
-        logger.info(f"📋 Mode: {args.mode.upper()}")
-        logger.info(f"⏰ Interval: {args.interval} minute(s)" if args.mode == 'continuous' else "")
+        logger.info("📋 Mode: %s", args.mode.upper())
+        if args.mode == 'continuous':
+            logger.info("⏰ Interval: %d minute(s)", args.interval)
+        
+        if args.with_dashboard and args.mode != 'dashboard':
+            _start_dashboard_process(args.dashboard_host, args.dashboard_port)
         
         if args.mode == 'dashboard':
-            logger.info(f"🌐 Starting dashboard on {args.dashboard_host}:{args.dashboard_port}")
+            logger.info("🌐 Starting dashboard on %s:%s", args.dashboard_host, args.dashboard_port)
+            from dashboard.app import start_dashboard
             return start_dashboard(host=args.dashboard_host, port=args.dashboard_port)
         
         if args.extract_only:
@@ -68,6 +90,7 @@ Examples:
             return run_extraction_only(args)
         
         # Initialize the complete processing pipeline
+        from processing.pipeline import ClaimsProcessingPipeline
         pipeline = ClaimsProcessingPipeline()
         
         if args.test:
@@ -83,9 +106,15 @@ Examples:
             pipeline.process_existing_emails(process_all=True)
             
         elif args.mode == 'continuous':
-            logger.info(f"🔄 Starting continuous processing (checking every {args.interval} minute(s))")
+            if args.idle:
+                logger.info("🔄 Starting continuous processing (woken by IMAP IDLE on new mail)")
+            else:
+                logger.info("🔄 Starting continuous processing (checking every %d minute(s))", args.interval)
             logger.info("Press Ctrl+C to stop processing")
-            pipeline.run_continuous_processing(interval_minutes=args.interval)
+            if args.idle:
+                pipeline.run_idle_processing(interval_minutes=args.interval)
+            else:
+                pipeline.run_continuous_processing(interval_minutes=args.interval)
         
         elif args.mode == 'extract':
             logger.info("📥 Running email extraction only...")
@@ -96,14 +125,30 @@ Examples:
     except KeyboardInterrupt:
         logger.info("⏹️ Processing interrupted by user")
     except Exception as e:
-        logger.error(f"❌ Application error: {str(e)}")
+        logger.error("❌ Application error: %s", e)
         logger.exception("Detailed error traceback:")
         sys.exit(1)
 
+def _start_dashboard_process(host: str, port: int):
+    """Serve the dashboard from a child process so it runs alongside the selected mode"""
+    # spawn rather than fork: the child starts clean instead of inheriting this process's threads and sockets
+    dashboard = multiprocessing.get_context('spawn').Process(
+        target=_run_dashboard, kwargs={'host': host, 'port': port}, name='dashboard', daemon=True
+    )
+    dashboard.start()
+    atexit.register(dashboard.terminate)
+    logger.info("🌐 Dashboard running on %s:%s (pid %s)", host, port, dashboard.pid)
+    return dashboard
+
+def _run_dashboard(host: str, port: int):
+    # Imported in the child so the parent never loads Flask
+    from dashboard.app import start_dashboard
+    start_dashboard(host=host, port=port)
+
 def run_extraction_only(args):
     """Run only email extraction without AI analysis"""
     try:
-        from config.settings import settings
+        from emails.email_processor import EmailProcessor
         
         # Update settings for extraction only
         settings.AUTO_PROCESS_AFTER_EXTRACTION = False
@@ -111,19 +156,21 @@ def run_extraction_only(args):
         settings.ENABLE_DUPLICATE_CHECK = False
         
         processor = EmailProcessor()
-        processed_emails = processor.process_emails(process_all=args.all)
+        processed_emails = processor.process_emails(process_all=args.all, bulk=args.fetch_batch_size,
+                                                    max_workers=max(1, args.max_workers),
+                                                    max_emails=args.max_emails)
         
         if processed_emails:
-            logger.info(f"✅ Extraction completed. Processed {len(processed_emails)} emails")
+            logger.info("✅ Extraction completed. Processed %d emails", len(processed_emails))
             for email in processed_emails:
-                logger.info(f"   📧 {email['subject']} from {email['sender_email']}")
-                logger.info(f"      📎 Attachments: {len(email['attachments'])}")
-                logger.info(f"      📄 PDF: {email.get('pdf_path', 'Unknown')}")
+                logger.info("   📧 %s from %s", email['subject'], email['sender_email'])
+                logger.info("      📎 Attachments: %d", len(email['attachments']))
+                logger.info("      📄 PDF: %s", email.get('pdf_path', 'Unknown'))
         else:
             logger.info("ℹ️ No emails were processed")
             
     except Exception as e:
-        logger.error(f"❌ Extraction error: {str(e)}")
+        logger.error("❌ Extraction error: %s", e)
         return 1
     return 0
 
@@ -132,74 +179,24 @@ def run_system_tests(pipeline):
     try:
         logger.info("🧪 Running system diagnostics...")
         
-        # Test 1: Check configuration
-        from config.settings import settings
+        # Test 1: Check configuration (everything else depends on it)
         logger.info("✅ Configuration loaded successfully")
-        logger.info(f"   📧 Email: {settings.EMAIL_USER}")
-        logger.info(f"   🤖 Gemini API: {'Configured' if settings.GEMINI_API_KEY else 'Not configured'}")
-        logger.info(f"   📁 Data directory: {settings.DATA_DIR}")
-        
-        # Test 2: Check directory structure
-        required_dirs = [
-            settings.PROCESSED_EMAILS_DIR,
-            settings.COMPILED_PDFS_DIR,
-            settings.REPORTS_DIR,
-            settings.PROCESSED_CLAIMS_DIR
-        ]
-        
-        for dir_path in required_dirs:
-            if os.path.exists(dir_path):
-                logger.info(f"✅ Directory exists: {dir_path}")
-            else:
-                logger.warning(f"⚠️ Directory missing: {dir_path}")
-                os.makedirs(dir_path, exist_ok=True)
-                logger.info(f"   📁 Created directory: {dir_path}")
+        logger.info("   📧 Email: %s", settings.EMAIL_USER)
+        logger.info("   🤖 Gemini API: %s", 'Configured' if settings.GEMINI_API_KEY else 'Not configured')
+        logger.info("   📁 Data directory: %s", settings.DATA_DIR)
         
-        # Test 3: Test email connection
-        logger.info("📧 Testing email connection...")
-        from emails.email_client import EmailClient
-        email_client = EmailClient()
-        if email_client.connect():
-            logger.info("✅ Email connection successful")
-            email_count = email_client.get_email_count()
-            logger.info(f"   📬 Emails in inbox: {email_count}")
-            email_client.disconnect()
-        else:
-            logger.error("❌ Email connection failed")
-            return 1
+        # Tests 2-5 are independent, so run them together; the slowest (usually Gemini) sets the wall time.
+        # Each returns its log records as (level, message, *args), logged afterwards in test order rather than interleaved
+        checks = [_test_directories, _test_email_connection, _test_gemini_api, _test_pdf_generation]
+        with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+            results = list(pool.map(lambda check: check(), checks))
         
-        # Test 4: Test Gemini API (if configured)
-        if settings.GEMINI_API_KEY:
-            logger.info("🤖 Testing Gemini API connection...")
-            try:
-                from gemini_integration.gemini_client import GeminiClient
-                gemini_client = GeminiClient()
-                test_response = gemini_client.analyze_content("Test connection - respond with 'OK'")
-                if "OK" in test_response.upper():
-                    logger.info("✅ Gemini API connection successful")
-                else:
-                    logger.warning("⚠️ Gemini API responded but with unexpected content")
-            except Exception as e:
-                logger.error(f"❌ Gemini API test failed: {str(e)}")
-        else:
-            logger.warning("⚠️ Gemini API key not configured - AI features will be limited")
-        
-        # Test 5: Check PDF generation capability
-        logger.info("📄 Testing PDF generation...")
-        try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.pdfgen import canvas
-            test_pdf_path = os.path.join(settings.REPORTS_DIR, "test_report.pdf")
-            c = canvas.Canvas(test_pdf_path, pagesize=A4)
-            c.drawString(100, 750, "Test PDF Generation")
-            c.save()
-            if os.path.exists(test_pdf_path):
-                logger.info("✅ PDF generation test passed")
-                os.remove(test_pdf_path)  # Clean up test file
-            else:
-                logger.error("❌ PDF generation test failed")
-        except Exception as e:
-            logger.error(f"❌ PDF generation test failed: {str(e)}")
+        for ok, lines in results:
+            for line in lines:
+                logger.log(*line)
+        # Only a failed email connection fails the run; the other checks just warn
+        if not all(ok for ok, _ in results):
+            return 1
         
         logger.info("🎉 All system tests completed successfully!")
         logger.info("\n📋 SYSTEM READY FOR PROCESSING")
@@ -212,14 +209,86 @@ def run_system_tests(pipeline):
         return 0
         
     except Exception as e:
-        logger.error(f"❌ System tests failed: {str(e)}")
+        logger.error("❌ System tests failed: %s", e)
         logger.exception("Detailed error traceback:")
         return 1
 
+def _test_directories() -> Tuple[bool, List[tuple]]:
+    """Test 2: check the directory structure, creating missing directories"""
+    lines = []
+    required_dirs = [
+        settings.PROCESSED_EMAILS_DIR,
+        settings.COMPILED_PDFS_DIR,
+        settings.REPORTS_DIR,
+        settings.PROCESSED_CLAIMS_DIR
+    ]
+    
+    for dir_path in required_dirs:
+        if os.path.exists(dir_path):
+            lines.append((logging.INFO, "✅ Directory exists: %s", dir_path))
+        else:
+            lines.append((logging.WARNING, "⚠️ Directory missing: %s", dir_path))
+            os.makedirs(dir_path, exist_ok=True)
+            lines.append((logging.INFO, "   📁 Created directory: %s", dir_path))
+    return True, lines
+
+def _test_email_connection() -> Tuple[bool, List[tuple]]:
+    """Test 3: connect to the mail server and count the inbox"""
+    lines = [(logging.INFO, "📧 Testing email connection...")]
+    try:
+        from emails.email_client import EmailClient
+        email_client = EmailClient()
+        if email_client.connect():
+            lines.append((logging.INFO, "✅ Email connection successful"))
+            email_count = email_client.get_email_count()
+            lines.append((logging.INFO, "   📬 Emails in inbox: %s", email_count))
+            email_client.disconnect()
+            return True, lines
+    except Exception as e:
+        lines.append((logging.ERROR, "❌ Email connection test failed: %s", e))
+        return False, lines
+    lines.append((logging.ERROR, "❌ Email connection failed"))
+    return False, lines
+
+def _test_gemini_api() -> Tuple[bool, List[tuple]]:
+    """Test 4: round-trip a prompt through Gemini (if configured)"""
+    if not settings.GEMINI_API_KEY:
+        return True, [(logging.WARNING, "⚠️ Gemini API key not configured - AI features will be limited")]
+    
+    lines = [(logging.INFO, "🤖 Testing Gemini API connection...")]
+    try:
+        from gemini_integration.gemini_client import GeminiClient
+        gemini_client = GeminiClient()
+        test_response = gemini_client.analyze_content("Test connection - respond with 'OK'")
+        if "OK" in test_response.upper():
+            lines.append((logging.INFO, "✅ Gemini API connection successful"))
+        else:
+            lines.append((logging.WARNING, "⚠️ Gemini API responded but with unexpected content"))
+    except Exception as e:
+        lines.append((logging.ERROR, "❌ Gemini API test failed: %s", e))
+    return True, lines
+
+def _test_pdf_generation() -> Tuple[bool, List[tuple]]:
+    """Test 5: check PDF generation capability"""
+    lines = [(logging.INFO, "📄 Testing PDF generation...")]
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+        # Rendered into memory: exercises ReportLab without writing and removing a file
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        c.drawString(100, 750, "Test PDF Generation")
+        c.save()
+        if buffer.getvalue().startswith(b'%PDF'):
+            lines.append((logging.INFO, "✅ PDF generation test passed"))
+        else:
+            lines.append((logging.ERROR, "❌ PDF generation test failed"))
+    except Exception as e:
+        lines.append((logging.ERROR, "❌ PDF generation test failed: %s", e))
+    return True, lines
+
 def display_system_info():
     """Display system information and status"""
-    from config.settings import settings
-    
     print("\n" + "="*60)
     print("🚢 MARINE REINSURANCE CLAIMS PROCESSING SYSTEM")
     print("="*60)
@@ -130,9 +130,16 @@ class PDFCompiler:
         
         claim_number = re.sub(r'[^\w\-]', '', claim_number)
         if claim_number == "UNKNOWN_CLAIM":
-            claim_number = f"CLAIM_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            claim_number = f"CLAIM_{self._output_timestamp(email_data)}"
         
         return claim_number
+    
+    @staticmethod
+    def _output_timestamp(email_data: Dict[str, Any]) -> str:
+        """Timestamp for output names, suffixed with the email id so workers finishing in the same second never collide"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        email_id = re.sub(r'[^\w\-]', '', str(email_data.get('id', '')))
+        return f"{timestamp}_{email_id}" if email_id else timestamp
 
     def detect_form_elements(self, pdf_path: str) -> Dict[str, Any]:
         """
@@ -317,7 +324,7 @@ class PDFCompiler:
             safe_claim_number = "".join(c for c in claim_number if c.isalnum() or c in ('-', '_'))
             
             # Create PDF filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = self._output_timestamp(email_data)
             pdf_filename = f"Claim_{safe_claim_number}_{timestamp}.pdf"
             pdf_path = os.path.join(self.output_dir, pdf_filename)
             
@@ -604,7 +611,7 @@ class PDFCompiler:
         """Create a comprehensive text file with ALL extracted content including structured data"""
         try:
             claim_number = self.extract_claim_number(email_data)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = self._output_timestamp(email_data)
             text_filename = f"Full_Extracted_Content_{claim_number}_{timestamp}.txt"
             text_path = os.path.join(self.output_dir, text_filename)
             
@@ -1,18 +1,23 @@
 import os
 import time
-import json
+import imaplib
 import logging
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+from imapclient.exceptions import IMAPClientAbortError
+
 from config.settings import settings
+from document_processing.document_reader import DocumentReader
+from emails.email_client import MailboxWatcher, IdleUnavailableError
 from emails.email_processor import EmailProcessor
 from gemini_integration.claims_analyzer import ClaimsAnalyzer
 from gemini_integration.fraud_detector import FraudDetector
 from gemini_integration.duplicate_detector import DuplicateDetector
 from reporting.report_generator import ReportGenerator
 from utils.logger import setup_logger
+from utils.helpers import read_json_file, write_json_file
 
 logger = setup_logger(__name__)
 
@@ -37,6 +42,7 @@ class ClaimsProcessingPipeline:
         self.fraud_detector = FraudDetector()
         self.duplicate_detector = DuplicateDetector()
         self.report_generator = ReportGenerator()
+        self.document_reader = DocumentReader()
         self.processed_claims = self._load_processed_claims()
     
     def _load_processed_claims(self) -> Dict[str, Any]:
@@ -44,8 +50,7 @@ class ClaimsProcessingPipeline:
         try:
             claims_file = os.path.join(settings.PROCESSED_CLAIMS_DIR, 'processed_claims.json')
             if os.path.exists(claims_file):
-                with open(claims_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return read_json_file(claims_file)
         except Exception as e:
             logger.error(f"Error loading processed claims: {str(e)}")
         return {}
@@ -54,21 +59,22 @@ class ClaimsProcessingPipeline:
         """Save processed claims to file"""
         try:
             claims_file = os.path.join(settings.PROCESSED_CLAIMS_DIR, 'processed_claims.json')
-            with open(claims_file, 'w', encoding='utf-8') as f:
-                json.dump(self.processed_claims, f, indent=2, ensure_ascii=False)
+            write_json_file(claims_file, self.processed_claims)
         except Exception as e:
             logger.error(f"Error saving processed claims: {str(e)}")
     
-    def process_single_claim(self, email_data: Dict[str, Any]) -> ProcessingResult:
-        """Process a single claim from email data"""
+    def process_single_claim(self, email_data: Dict[str, Any], claim_analysis: Dict[str, Any] = None,
+                             fraud_analysis: Dict[str, Any] = None) -> ProcessingResult:
+        """Process a single claim from email data, reusing claim_analysis and fraud_analysis if batch computed"""
         try:
             logger.info(f"Processing claim from email: {email_data['subject']}")
             
-            # Extract text content from compiled PDF
-            pdf_text = self._extract_pdf_content(email_data['pdf_path'])
-            
-            # Analyze claim using Gemini
-            claim_analysis = self.claims_analyzer.analyze_claim(pdf_text, email_data)
+            if claim_analysis is None:
+                # Extract text content from compiled PDF
+                pdf_text = self._extract_pdf_content(email_data['pdf_path'])
+                
+                # Analyze claim using Gemini
+                claim_analysis = self.claims_analyzer.analyze_claim(pdf_text, email_data)
             
             # Check for duplicates
             duplicate_check = self.duplicate_detector.check_duplicate(
@@ -76,7 +82,8 @@ class ClaimsProcessingPipeline:
             )
             
             # Detect fraud
-            fraud_analysis = self.fraud_detector.detect_fraud(claim_analysis, email_data)
+            if fraud_analysis is None:
+                fraud_analysis = self.fraud_detector.detect_fraud(claim_analysis, email_data)
             
             # Generate comprehensive report
             report_data = {
@@ -114,6 +121,7 @@ class ClaimsProcessingPipeline:
                     'fraud_score': result.fraud_score,
                     'analysis_summary': claim_analysis.get('summary', {})
                 }
+                self.duplicate_detector.add_claim(result.claim_number, self.processed_claims[result.claim_number])
                 self._save_processed_claims()
             
             logger.info(f"Successfully processed claim {result.claim_number}")
@@ -138,9 +146,7 @@ class ClaimsProcessingPipeline:
     def _extract_pdf_content(self, pdf_path: str) -> str:
         """Extract text content from PDF file"""
         try:
-            from document_processing.document_reader import DocumentReader
-            reader = DocumentReader()
-            return reader.extract_text_from_pdf(pdf_path)
+            return self.document_reader.extract_text_from_pdf(pdf_path)
         except Exception as e:
             logger.error(f"Error extracting PDF content: {str(e)}")
             return ""
@@ -151,18 +157,7 @@ class ClaimsProcessingPipeline:
         
         while True:
             try:
-                # Process new emails
-                processed_emails = self.email_processor.process_emails(process_all=False)
-                
-                if processed_emails:
-                    logger.info(f"Found {len(processed_emails)} new emails to process")
-                    
-                    for email_data in processed_emails:
-                        try:
-                            result = self.process_single_claim(email_data)
-                            self._log_processing_result(result)
-                        except Exception as e:
-                            logger.error(f"Error processing email {email_data['id']}: {str(e)}")
+                self._process_new_emails()
                 
                 # Wait for next interval
                 time.sleep(interval_minutes * 60)
@@ -174,6 +169,79 @@ class ClaimsProcessingPipeline:
                 logger.error(f"Error in continuous processing: {str(e)}")
                 time.sleep(interval_minutes * 60)  # Wait before retrying
     
+    def run_idle_processing(self, interval_minutes: int = 1):
+        """Run continuous processing woken by IMAP IDLE, polling every interval only if IDLE is unavailable"""
+        logger.info("Starting continuous processing (waiting for new mail with IMAP IDLE)")
+        
+        watcher = MailboxWatcher()
+        use_idle = True
+        pending = True  # Sweep once on start-up
+        
+        try:
+            while True:
+                try:
+                    if pending:
+                        self._process_new_emails()
+                        pending = False
+                    
+                    if use_idle:
+                        # Returns on new mail, or when IDLE has to be re-issued before the server drops it
+                        pending = watcher.wait_for_mail(MailboxWatcher.MAX_IDLE_SECONDS)
+                    else:
+                        time.sleep(interval_minutes * 60)
+                        pending = True
+                    
+                except IdleUnavailableError:
+                    if not watcher.idle_supported:
+                        logger.warning("IMAP IDLE not supported, falling back to polling")
+                        use_idle = False
+                    else:
+                        time.sleep(interval_minutes * 60)  # Retry the IDLE connection later
+                    pending = True
+                except (IMAPClientAbortError, imaplib.IMAP4.abort) as e:
+                    # Back off so a server that keeps dropping the connection is not hammered with logins
+                    delay = watcher.reconnect_delay()
+                    logger.warning(f"IDLE connection aborted, reconnecting in {delay}s: {str(e)}")
+                    time.sleep(delay)
+                    pending = True
+                except KeyboardInterrupt:
+                    logger.info("Processing interrupted by user")
+                    break
+                except Exception as e:
+                    logger.error(f"Error in continuous processing: {str(e)}")
+                    time.sleep(interval_minutes * 60)  # Wait before retrying
+                    pending = True
+        finally:
+            watcher.disconnect()
+    
+    def _process_new_emails(self):
+        """Extract new emails and run the batched claim and fraud analysis over them"""
+        processed_emails = self.email_processor.process_emails(process_all=False)
+        
+        if processed_emails:
+            logger.info(f"Found {len(processed_emails)} new emails to process")
+            
+            # Analyze every new claim up front so Gemini sees them in a few batched requests
+            claims = [(self._extract_pdf_content(email_data.get('pdf_path', '')), email_data)
+                      for email_data in processed_emails]
+            claim_analyses = self.claims_analyzer.analyze_claims_batch(claims)
+            fraud_analyses = self._batch_fraud_analyses(claim_analyses, processed_emails)
+            
+            for email_data, claim_analysis, fraud_analysis in zip(processed_emails, claim_analyses, fraud_analyses):
+                try:
+                    result = self.process_single_claim(email_data, claim_analysis, fraud_analysis)
+                    self._log_processing_result(result)
+                except Exception as e:
+                    logger.error(f"Error processing email {email_data['id']}: {str(e)}")
+    
+    def _batch_fraud_analyses(self, claim_analyses: List[Dict[str, Any]], emails: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Fraud analyses for a batch; None entries make process_single_claim analyze the claim itself"""
+        try:
+            return self.fraud_detector.detect_fraud_batch(list(zip(claim_analyses, emails)))
+        except Exception as e:
+            logger.error(f"Error in batch fraud detection: {str(e)}")
+            return [None] * len(emails)
+    
     def _log_processing_result(self, result: ProcessingResult):
         """Log processing results"""
         status_icon = "🔄" if result.processing_status == 'processing' else "✅" if result.processing_status == 'completed' else "❌"
@@ -244,8 +312,7 @@ def process_existing_emails(self, process_all=False):
             }
             
             summary_file = os.path.join(settings.REPORTS_DIR, f"processing_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-            with open(summary_file, 'w', encoding='utf-8') as f:
-                json.dump(summary, f, indent=2, ensure_ascii=False)
+            write_json_file(summary_file, summary)
             
             logger.info(f"Processing summary saved to: {summary_file}")
             
@@ -22,6 +22,7 @@ class ProcessingItem:
 
 class ProcessingQueueManager:
     def __init__(self):
+        settings.ensure_dirs()
         self.queue_dir = settings.PROCESSING_QUEUE_DIR
         self.processed_dir = settings.PROCESSED_CLAIMS_DIR
         self.queue_file = os.path.join(self.queue_dir, 'processing_queue.json')
@@ -1,5 +1,7 @@
 import os
 import shutil
+import hashlib
+import threading
 import logging
 from datetime import datetime
 from typing import List, Dict, Any
@@ -16,6 +18,8 @@ class FileManager:
             'raw_attachments': settings.RAW_ATTACHMENTS_DIR,
             'reports': settings.REPORTS_DIR
         }
+        # Content-addressed pool of attachment files, hard-linked into each email folder
+        self.cas_root = os.path.join(settings.PROCESSED_EMAILS_DIR, '_cas')
     
     def save_email_attachments(self, email_id: str, attachments: List[Dict]) -> List[str]:
         """Save email attachments to organized folder structure"""
@@ -33,8 +37,7 @@ class FileManager:
                 
                 # Save attachment
                 file_path = os.path.join(attachment_dir, attachment['filename'])
-                with open(file_path, 'wb') as f:
-                    f.write(attachment['data'])
+                shutil.copyfile(attachment['path'], file_path)
                 
                 saved_paths.append(file_path)
                 logger.info(f"Saved attachment: {file_path}")
@@ -44,6 +47,33 @@ class FileManager:
         
         return saved_paths
     
+    def store_deduplicated(self, source_path: str, dest_path: str) -> str:
+        """Move a file into the content-addressed pool, hard-link it at dest_path and return its SHA-256"""
+        hasher = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        
+        cas_path = os.path.join(self.cas_root, digest[:2], digest)
+        if os.path.exists(cas_path):
+            os.remove(source_path)
+        else:
+            # Stage next to the pool entry so concurrent savers of the same content never see a partial file
+            os.makedirs(os.path.dirname(cas_path), exist_ok=True)
+            tmp_path = f"{cas_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.move(source_path, tmp_path)
+            os.replace(tmp_path, cas_path)
+        
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(cas_path, dest_path)
+        except OSError:
+            # Filesystems without hard links still get a plain copy
+            shutil.copyfile(cas_path, dest_path)
+        return digest
+    
     def cleanup_old_files(self, days_old: int = 30):
         """Clean up files older than specified days"""
         try:
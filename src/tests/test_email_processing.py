@@ -0,0 +1,62 @@
+"""
+Tests for BODYSTRUCTURE handling in the email client
+"""
+
+import os
+import sys
+
+# Add the src directory and the project root to Python path
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (src_dir, os.path.dirname(src_dir)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from imapclient.response_parser import parse_fetch_response
+
+from emails.email_client import EmailClient
+
+
+def _classify(bodystructure: bytes):
+    """Parse a raw FETCH BODYSTRUCTURE response and split it like fetch_emails does"""
+    parsed = parse_fetch_response([b'1 (BODYSTRUCTURE ' + bodystructure + b')'], False, False)
+    return EmailClient()._classify_parts(parsed[1][b'BODYSTRUCTURE'])
+
+
+def test_rfc2231_filename_is_decoded():
+    text_parts, attachments = _classify(
+        b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL)'
+        b'("APPLICATION" "PDF" NIL NIL NIL "BASE64" 2048 NIL'
+        b' ("ATTACHMENT" ("FILENAME*" "UTF-8\'\'Schadensmeldung%20%C3%BCber%20Ladung.pdf")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "x") NIL NIL NIL)'
+    )
+
+    assert [part['section'] for part in text_parts] == ['1']
+    assert attachments[0]['filename'] == 'Schadensmeldung über Ladung.pdf'
+    assert attachments[0]['section'] == '2'
+
+
+def test_rfc2231_filename_continuations_are_joined():
+    _, attachments = _classify(
+        b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL)'
+        b'("APPLICATION" "PDF" NIL NIL NIL "BASE64" 2048 NIL'
+        b' ("ATTACHMENT" ("FILENAME*0*" "UTF-8\'\'%E2%82%AC%20Survey%20" "FILENAME*1*" "Report.pdf")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "x") NIL NIL NIL)'
+    )
+
+    assert attachments[0]['filename'] == '€ Survey Report.pdf'
+
+
+def test_forwarded_message_attachments_are_found():
+    _, attachments = _classify(
+        b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 4096'
+        b' (NIL "Fwd: claim" NIL NIL NIL NIL NIL NIL NIL NIL)'
+        b' (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 20 2 NIL NIL NIL NIL)'
+        b'("APPLICATION" "PDF" ("NAME" "bill_of_lading.pdf") NIL NIL "BASE64" 1024 NIL'
+        b' ("ATTACHMENT" ("FILENAME" "bill_of_lading.pdf")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "y") NIL NIL NIL)'
+        b' 60 NIL ("ATTACHMENT" ("FILENAME" "forwarded.eml")) NIL NIL)'
+        b' "MIXED" ("BOUNDARY" "x") NIL NIL NIL)'
+    )
+
+    assert [(a['filename'], a['section']) for a in attachments] == [('bill_of_lading.pdf', '2.2')]
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+import orjson
+
+from utils.helpers import read_json_file
+
+_MISSING = object()
+
+class TTLCache:
+    """Thread-safe in-memory cache with a size bound and per-entry time-to-live"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove and return a value"""
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self.set(key, value)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class FileCache:
+    """JSON-serializable values stored one file per key, surviving restarts; ttl of 0 never expires
+
+    Expired files, and the oldest ones beyond max_entries (0 = unbounded), are swept on the first
+    set() and then at most every SWEEP_INTERVAL seconds, so keys that are never read again still go.
+    """
+
+    SWEEP_INTERVAL = 600
+
+    def __init__(self, directory: str, ttl: float = 0, max_entries: int = 0):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._next_sweep = 0.0
+        self._sweep_lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the stored value, or default if missing, expired or unreadable"""
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.stat(path).st_mtime > self.ttl:
+                os.remove(path)
+                return default
+            return read_json_file(path)
+        except (OSError, orjson.JSONDecodeError):
+            return default
+
+    def set(self, key: str, value: Any):
+        """Store a value, replacing the file atomically so concurrent readers never see partial JSON"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(value))
+        os.replace(tmp_path, path)
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        if not (self.ttl or self.max_entries):
+            return
+        now = time.monotonic()
+        # Only one thread sweeps; the others skip rather than wait on a directory scan
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + self.SWEEP_INTERVAL
+            self.sweep()
+        finally:
+            self._sweep_lock.release()
+
+    def sweep(self) -> int:
+        """Remove expired files, then the least recently written ones beyond max_entries; returns the count removed"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass  # Removed by another process mid-scan
+        entries.sort()  # Oldest first
+
+        stale = []
+        if self.ttl:
+            cutoff = time.time() - self.ttl
+            while entries and entries[0][0] < cutoff:
+                stale.append(entries.pop(0)[1])
+        if self.max_entries and len(entries) > self.max_entries:
+            stale.extend(path for _, path in entries[:len(entries) - self.max_entries])
+
+        removed = 0
+        for path in stale:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
@@ -0,0 +1,65 @@
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
+
+import orjson
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Files at least this large are parsed straight from a memory map instead of a bytes copy
+MMAP_THRESHOLD_BYTES = 1024 * 1024
+
+def read_json_file(path: str) -> Any:
+    """Parse a JSON file with orjson, memory-mapping large files"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+        return orjson.loads(f.read())
+
+def write_json_file(path: str, data: Any):
+    """Serialize data with orjson (2-space indent, UTF-8) and atomically replace the file
+    
+    The bytes go to a sibling temp file first, so a crash mid-write leaves the previous version intact.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive advisory lock on path (created if missing) across processes; no-op without fcntl"""
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def append_jsonl_file(path: str, entries: Iterable[Any]):
+    """Append entries to a JSON Lines file with a single write"""
+    payload = b''.join(orjson.dumps(entry) + b'\n' for entry in entries)
+    if not payload:
+        return
+    with open(path, 'ab') as f:
+        # Writes larger than PIPE_BUF are not atomic under O_APPEND, so serialize concurrent writers
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(payload)
+
+def iter_jsonl_file(path: str) -> Iterator[Any]:
+    """Yield the entries of a JSON Lines file one at a time"""
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)